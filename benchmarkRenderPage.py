@@ -0,0 +1,103 @@
+import logging
+import time
+import myModules
+import argparse
+
+#
+# Measures the time render_page spends on large, table heavy pages, and its handlers run in a single
+# walk of the tree against one find_all pass per handler.
+# No Confluence site is needed, the page is generated unless --html-file is given.
+#
+parser = argparse.ArgumentParser()
+parser.add_argument('--size', type=float, default=5,
+                    help='Size in MB of the generated page. Default 5')
+parser.add_argument('--html-file', type=str,
+                    help='Use the export_view HTML in this file rather than a generated page')
+parser.add_argument('--pages', type=int, default=3,
+                    help='Number of times the page is rendered. Default 3')
+parser.add_argument('--rst', action='store_true', default=False,
+                    help='Also convert to RST with pandoc')
+parser.add_argument('--parser', default='html.parser', choices=myModules.html_parsers,
+                    help='Parser of the page, html.parser is used when lxml or html5lib is not installed (default html.parser)')
+parser.add_argument('--loglevel', default='error',
+                    choices=['critical', 'error', 'warning', 'info', 'debug'],
+                    help='Provide logging level. Example --loglevel debug, default=error')
+args = parser.parse_args()
+logging.basicConfig(level=args.loglevel.upper())
+print(f"Parser: {myModules.set_html_parser(args.parser)}")
+
+site = "benchmark"
+space_key = "BENCH"
+page_id = "1000"
+space_pages_short = [{'page_id': str(n), 'pageTitle': f"Page {n}", 'parentId': None if n == 1000 else "1000", 'space_id': "1"} for n in range(1000, 1500)]
+space_index = myModules.SpaceIndex(site, space_key, space_pages_short)
+
+def generate_page(arg_size):
+    """Build an export_view like page of about arg_size MB, mostly tables with links, images and code"""
+    rows = []
+    row_counter = 0
+    size = 0
+    while size < arg_size * 1024 * 1024:
+        linked_page = 1000 + row_counter % 500
+        row = (f"<tr><td class=\"confluenceTd\"><p>Row {row_counter}</p></td>"
+               f"<td class=\"confluenceTd\"><a href=\"https://{site}.atlassian.net/wiki/spaces/{space_key}/pages/{linked_page}/Page+{linked_page}#section\">Page {linked_page}</a></td>"
+               f"<td class=\"confluenceTd\"><img class=\"confluence-embedded-image\" src=\"https://{site}.atlassian.net/wiki/download/attachments/{page_id}/image{row_counter}.png\"/></td>"
+               f"<td class=\"confluenceTd\"><a href=\"https://www.example.com/{row_counter}\">external</a> some <strong>text</strong> and <em>more</em> text</td></tr>\n")
+        if row_counter % 50 == 0:
+            row += (f"<tr><td colspan=\"4\"><div class=\"expand-control\"><img class=\"expand-control-image\" src=\"https://{site}.atlassian.net/wiki/images/grey_arrow_down.png\"/></div>"
+                    f"<pre class=\"syntaxhighlighter-pre\">print({row_counter})</pre></td></tr>\n")
+        rows.append(row)
+        size = size + len(row)
+        row_counter = row_counter + 1
+    return("<table class=\"confluenceTable\"><tbody>\n" + "".join(rows) + "</tbody></table>\n")
+
+def page_assets(arg_html):
+    """What fetch_page_assets would return, without downloading anything"""
+    soup = myModules.parse_html(arg_html, myModules.SoupStrainer('img'))
+    return({
+        'attachments': [],
+        'images': [img.attrs for img in soup.find_all('img')],
+        'report_children': None,
+        'page_url': f"https://{site}.atlassian.net/wiki/spaces/{space_key}/pages/{page_id}",
+        'breadcrumbs': [],
+        'space_links': {page_id: space_index.file_names[page_id] for page_id in set(space_index.linked_pages_regex.findall(arg_html))},
+        'space_root': space_index.file_names[space_index.root("1")['page_id']]
+        })
+
+if args.html_file:
+    with open(args.html_file, 'r', encoding='utf-8') as html_file:
+        html = html_file.read()
+else:
+    html = generate_page(args.size)
+assets = page_assets(html)
+print(f"Page: {len(html) / 1024 / 1024:.1f} MB, {len(assets['images'])} images")
+
+def rewrite_multi_pass(arg_soup, arg_rewriter):
+    """Run the handlers of a page rewriter the way render_page did before DomRewriter, one find_all per handler"""
+    for (tag, handlers) in arg_rewriter.handlers.items():
+        for (tag_class, handler) in handlers:
+            for node in (arg_soup.find_all(tag) if tag_class is None else arg_soup.find_all(tag, class_=tag_class)):
+                handler(node)
+
+def page_rewriter():
+    return(myModules.page_rewriter(site, space_key, "Page 1000", page_id, assets, arg_html_output=True))
+
+timings = []
+for n in range(args.pages):
+    start = time.perf_counter()
+    soup = myModules.parse_html(html)
+    parsed = time.perf_counter()
+    visited = page_rewriter().rewrite(soup)
+    walked = time.perf_counter()
+    soup = myModules.parse_html(html)
+    multi_pass_start = time.perf_counter()
+    rewrite_multi_pass(soup, page_rewriter())
+    multi_passed = time.perf_counter()
+    myModules.render_page(site, space_key, html, "Page 1000", page_id, "", None, assets,
+        arg_html_output=True, arg_rst_output=args.rst)
+    rendered = time.perf_counter()
+    timings.append((walked - parsed, multi_passed - multi_pass_start, rendered - multi_passed))
+    print(f"Page {n + 1}: parse {parsed - start:.2f}s, handlers in one walk of {visited} tags {walked - parsed:.2f}s, "
+          f"handlers in one find_all pass each {multi_passed - multi_pass_start:.2f}s, render_page {rendered - multi_passed:.2f}s")
+for (name, times) in zip(["single walk", "find_all passes", "render_page"], zip(*timings)):
+    print(f"{name}: best {min(times):.2f}s, average {sum(times) / len(times):.2f}s")
@@ -1,5 +1,6 @@
 import os.path
 import argparse
+from datetime import datetime, timezone
 import logging
 import myModules
 
@@ -21,9 +22,35 @@ Returns:
 """
 
 
+def since_time(arg_since):
+    """Parse the --since option, 'last' or an ISO 8601 time, local time when it has no time zone"""
+    if arg_since == 'last':
+        return(arg_since)
+    try:
+        since = datetime.fromisoformat(arg_since)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO 8601 time or 'last': {arg_since!r}")
+    if since.tzinfo is None:
+        since = since.astimezone()      # local time
+    return(since)
+
+def positive_int(arg_value):
+    """Parse an option that is a number of workers, at least 1"""
+    value = int(arg_value)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {arg_value}")
+    return(value)
+
+def positive_float(arg_value):
+    """Parse an option that is a rate, above 0"""
+    value = float(arg_value)
+    if not value > 0:
+        raise argparse.ArgumentTypeError(f"must be above 0: {arg_value}")
+    return(value)
+
 parser = argparse.ArgumentParser()
 parser.add_argument('--mode', '-m', dest='mode',
-                    choices=['single', 'space', 'bylabel', 'pageprops', 'recursive'],
+                    choices=['single', 'space', 'delta', 'bylabel', 'pageprops', 'recursive'],
                     help='Chose a download mode', required=True)
 parser.add_argument('--site', '-S', type=str,
                     help='Atlassian Site', required=True)
@@ -33,6 +60,8 @@ parser.add_argument('--page', '-p', type=int,
                     help='Page ID')
 parser.add_argument('--label', '-l', type=str,
                     help='Page label')
+parser.add_argument('--since', type=since_time, default='last',
+                    help='In delta mode, export the pages modified after this ISO 8601 time, or "last" for the last successful export (default)')
 parser.add_argument('--outdir', '-o', type=str, default='output',
                     help='Folder for export', required=False)
 parser.add_argument('--sphinx', '-x', action='store_true', default=False,
@@ -47,8 +76,40 @@ parser.add_argument('--no-rst', action='store_false', dest="rst", default=True,
                     help='Disable .rst file in export', required=False)
 parser.add_argument('--showlabels', action='store_true', default=False,
                     help='Export .rst files with the page labels at the bottom', required=False)
+parser.add_argument('--index-json', action='store_true', default=False, dest='index_json',
+                    help='In space mode with --html, write the page tree to index.js, that index.html loads and unfolds in the browser, for large spaces', required=False)
 parser.add_argument('--relativelinks', action='store_true', default=False,
                     help='Replace the a href links with relative links within the current space when exporting to html.', required=False)
+parser.add_argument('--pool-size', type=int, default=10, dest='pool_size',
+                    help='Smallest number of HTTP connections kept alive to the Atlassian site, the pool is at least as large as --workers, --fetch-concurrency and --download-workers (default 10)', required=False)
+parser.add_argument('--max-rate', type=positive_float, default=20.0, dest='max_rate',
+                    help='Highest number of API requests per second, lowered automatically when Atlassian throttles', required=False)
+parser.add_argument('--max-retries', type=int, default=5, dest='max_retries',
+                    help='Number of retries of a request after a 429, 5xx or connection error', required=False)
+parser.add_argument('--cache-dir', type=str, dest='cache_dir',
+                    help='Folder for a persistent cache of the API responses, re-runs only download what changed', required=False)
+parser.add_argument('--cache-size', type=int, default=1024, dest='cache_size',
+                    help='Size limit of the response cache in MB (default 1024)', required=False)
+parser.add_argument('--incremental', action='store_true', default=False,
+                    help='In space and recursive mode, only export the pages that changed since the last export and delete the output of removed pages', required=False)
+parser.add_argument('--workers', '-w', type=int, default=1,
+                    help='Number of pages exported at the same time in space and recursive mode', required=False)
+parser.add_argument('--processes', type=int, default=0,
+                    help='Number of processes converting pages to HTML and RST in space and recursive mode (default 0, convert in the export workers)', required=False)
+parser.add_argument('--no-bulk', action='store_false', dest='bulk', default=True,
+                    help='In space mode, fetch the body and labels of every page separately instead of in batches of pages', required=False)
+parser.add_argument('--fetch-concurrency', type=int, default=20, dest='fetch_concurrency',
+                    help='Maximum number of API requests in flight when prefetching pages in space mode', required=False)
+parser.add_argument('--download-workers', type=positive_int, default=16, dest='download_workers',
+                    help='Number of attachments and images downloaded at the same time, for all pages (default 16)', required=False)
+parser.add_argument('--no-blob-store', action='store_false', dest='blob_store', default=True,
+                    help='Store every downloaded file where it is used, instead of once in a .blobs folder of the output folder with links to it', required=False)
+parser.add_argument('--external-timeout', type=float, default=10.0, dest='external_timeout',
+                    help='Seconds to wait for an external host serving an embedded image, to connect and between two reads (default 10)', required=False)
+parser.add_argument('--failure-ttl', type=float, default=24.0, dest='failure_ttl',
+                    help='Hours a failed external image, or a failing external host, is not tried again, also by the next runs (default 24)', required=False)
+parser.add_argument('--parser', default='html.parser', choices=myModules.html_parsers, dest='parser',
+                    help='Parser of the page bodies, html.parser is used when lxml or html5lib is not installed (default html.parser)', required=False)
 parser.add_argument('--loglevel', default='debug',
                     choices=['critical', 'error', 'warning', 'info', 'debug'],
                     help='Provide logging level. Example --loglevel debug, default=warning')
@@ -62,6 +123,10 @@ if args.logfile is None:
     logging.basicConfig(level=args.loglevel.upper(), format=args.logformat)
 else:
     logging.basicConfig(level=args.loglevel.upper(), format=args.logformat, filename=args.logfile)
+myModules.set_html_parser(args.parser)
+
+# started before any other thread, the processes are forked
+render_pool = myModules.start_render_pool(args.processes) if args.mode in ('space','delta','recursive') else None
 
 atlassian_site = args.site
 sphinx_tags = args.tags
@@ -74,6 +139,9 @@ if args.mode == 'single':
 elif args.mode == 'space':
     logging.info(f"Exporting a whole space (Sphinx set to {args.sphinx})")
     space_key = args.space
+elif args.mode == 'delta':
+    logging.info(f"Exporting the pages of a space modified since {args.since} (Sphinx set to {args.sphinx})")
+    space_key = args.space
 elif args.mode == 'recursive':
     logging.info(f"Exporting a single page recursively (Sphinx set to {args.sphinx})")
 elif args.mode == 'bylabel':
@@ -89,12 +157,35 @@ my_emoticons_list = []
 
 user_name = os.environ["atlassianUserEmail"]
 api_token = os.environ["atlassianAPIToken"]
+myModules.get_http_client(user_name,api_token,arg_pool_size=max(args.pool_size,args.workers,args.fetch_concurrency,args.download_workers),
+    arg_max_rate=args.max_rate,arg_max_retries=args.max_retries)
+myModules.get_download_scheduler(args.download_workers)
+myModules.configure_external_downloads(args.external_timeout,args.failure_ttl * 3600)
+if args.blob_store:
+    myModules.enable_blob_store(os.path.join(args.outdir,".blobs"))
+response_cache = None
+if args.cache_dir is not None:
+    response_cache = myModules.enable_response_cache(user_name,api_token,args.cache_dir,args.cache_size * 1024 * 1024)
 
 logging.debug("Sphinx set to " + str(sphinx_compatible))
 logging.debug(f"Confluence compatible set to : {confluence_compatible}")
 atlassian_site = args.site
 my_outdir_base = args.outdir
 relative_links = args.relativelinks
+# a manifest written with other options than these is not used
+export_options = {
+    'html' : args.html,
+    'rst' : args.rst,
+    'sphinx' : sphinx_compatible,
+    'tags' : sphinx_tags,
+    'confluence' : confluence_compatible,
+    'relativelinks' : relative_links,
+    'showlabels' : args.showlabels,
+    'parser' : myModules.html_parser,           # the one used, html.parser when the chosen one is not installed
+    'index_json' : args.index_json,
+    }
+manifest = None
+space_index = None      # pages of the space by id, for relative links
 if args.mode == 'single':
     ############
     ## SINGLE ##
@@ -127,6 +218,7 @@ if args.mode == 'single':
                 'space_id' : n['spaceId'],
                 }
             )
+        space_index = myModules.SpaceIndex(atlassian_site,space_key,all_pages_short,confluence_compatible)
 
     if confluence_compatible:
         my_outdir_base = os.path.join(my_outdir_base,space_key)
@@ -143,7 +235,7 @@ if args.mode == 'single':
     my_outdirs = myModules.mk_outdirs(my_outdir_base, page_id, confluence_compatible)               # attachments, embeds, scripts
     my_page_labels = myModules.get_page_labels(atlassian_site,page_id,user_name,api_token)
     logging.debug(f"Base export folder is \"{my_outdir_base}\" and the Content goes to \"{my_outdir_content}\"")
-    myModules.dump_html(atlassian_site,space_key,my_body_export_view_html,my_body_export_view_title,page_id,my_outdir_base, my_outdir_content,my_page_labels,page_parent,user_name,api_token,sphinx_compatible,sphinx_tags,arg_html_output=args.html,arg_rst_output=args.rst,arg_space_pages_short=(all_pages_short if relative_links else []),arg_confluence_compatible=confluence_compatible)
+    myModules.dump_html(atlassian_site,space_key,my_body_export_view_html,my_body_export_view_title,page_id,my_outdir_base, my_outdir_content,my_page_labels,page_parent,user_name,api_token,sphinx_compatible,sphinx_tags,arg_html_output=args.html,arg_rst_output=args.rst,arg_space_index=space_index,arg_confluence_compatible=confluence_compatible,arg_page=my_body_export_view)
     logging.info("Done!")
 
 if args.mode == 'recursive':
@@ -173,8 +265,11 @@ if args.mode == 'recursive':
             'pageTitle' : n['title'],
             'parentId' : n['parentId'],
             'space_id' : n['spaceId'],
+            'version' : n['version']['number'],
             }
         )
+    if relative_links:
+        space_index = myModules.SpaceIndex(atlassian_site,space_key,all_pages_short,confluence_compatible)
 
     if confluence_compatible:
         my_outdir_base = os.path.join(my_outdir_base,space_key)
@@ -192,70 +287,61 @@ if args.mode == 'recursive':
     my_page_labels = myModules.get_page_labels(atlassian_site,page_id,user_name,api_token)
     logging.debug(f"Base export folder is \"{my_outdir_base}\" and the Content goes to \"{my_outdir_content}\"")
     
-    all_pages_recursive = []
-    for p in all_pages_short:
-        if p['page_id'] == str(page_id):        
-            def get_child_pages(arg_page_id):
-                children = []
-                child_pages = list(filter (lambda x: x['parentId'] == arg_page_id, all_pages_short))
-                for child_page in child_pages:
-                    # Add the children of the provided page id.
-                    children.append(child_page)
-                    # Get the children of the child page.
-                    child_page_id = child_page['page_id']
-                    child_pages = list(filter (lambda x: x['parentId'] == child_page_id, all_pages_short))
-                    [children.append(x) for x in child_pages if x not in children]
-                    # Get the recursive children of the current child page.
-                    [children.append(x) for x in get_child_pages(child_page_id) if x not in children]
-                return children
-            all_pages_recursive = get_child_pages(p['page_id'])
-            all_pages_recursive.append(p)
-
-    page_counter = 0
-    for p in all_pages_recursive:
-        page_counter = page_counter + 1
-        my_body_export_view = myModules.get_body_export_view(atlassian_site,p['page_id'],user_name,api_token).json()
+    # the page and all its descendants
+    page_tree = space_index if space_index is not None else myModules.PageTree(all_pages_short)
+    all_pages_recursive = page_tree.subtree(str(page_id))
+    if args.incremental:
+        manifest = myModules.ExportManifest(my_outdir_content, export_options)
+        all_pages_recursive = manifest.changed_pages(all_pages_recursive, confluence_compatible)
+
+    # the top page was already fetched above
+    page_documents = {str(page_id): my_body_export_view}
+    def export_recursive_page(page_counter, p):
+        my_body_export_view = page_documents.pop(p['page_id'], None)
+        if my_body_export_view is None:
+            my_body_export_view = myModules.get_body_export_view(atlassian_site,p['page_id'],user_name,api_token).json()
         my_body_export_view_html = my_body_export_view['body']['export_view']['value']
         my_body_export_view_name = p['pageTitle']
         my_body_export_view_title = p['pageTitle']
         logging.debug("")
-        logging.debug(f"Getting page #{page_counter}/{len(all_pages_short)}, {my_body_export_view_title}, {p['page_id']}")
+        logging.debug(f"Getting page #{page_counter}/{len(all_pages_recursive)}, {my_body_export_view_title}, {p['page_id']}")
         my_body_export_view_labels = myModules.get_page_labels(atlassian_site,p['page_id'],user_name,api_token)
         #my_body_export_view_labels = ",".join(myModules.get_page_labels(atlassian_site,p['page_id'],user_name,api_token))
         mypage_url = f"{my_body_export_view['_links']['base']}{my_body_export_view['_links']['webui']}"
         logging.debug(f"dump_html arg sphinx_compatible = {sphinx_compatible}")
-        myModules.dump_html(atlassian_site,space_key,my_body_export_view_html,my_body_export_view_title,p['page_id'],my_outdir_base,my_outdir_content,my_body_export_view_labels,p['parentId'],user_name,api_token,sphinx_compatible,sphinx_tags,arg_html_output=args.html,arg_rst_output=args.rst,arg_space_pages_short=(all_pages_short if relative_links else []),arg_confluence_compatible=confluence_compatible)
+        my_output = myModules.dump_html(atlassian_site,space_key,my_body_export_view_html,my_body_export_view_title,p['page_id'],my_outdir_base,my_outdir_content,my_body_export_view_labels,p['parentId'],user_name,api_token,sphinx_compatible,sphinx_tags,arg_html_output=args.html,arg_rst_output=args.rst,arg_space_index=space_index,arg_confluence_compatible=confluence_compatible,arg_render_executor=render_pool,arg_page=my_body_export_view)
+        if manifest is not None:
+            manifest.record(p, my_output)
+
+    failed_pages = myModules.export_pages(all_pages_recursive, export_recursive_page, args.workers)
+    if len(failed_pages) > 0:
+        logging.error(f"{len(failed_pages)} of {len(all_pages_recursive)} pages could not be exported: {', '.join(p['page_id'] for (p,e) in failed_pages)}")
+    if manifest is not None:
+        for (p,e) in failed_pages:
+            manifest.record_failure(p)
+        logging.info(f"Removed {manifest.save()} files of removed, moved or renamed pages")
     logging.info("Done!")
 
-elif args.mode == 'space':
+elif args.mode in ('space','delta'):
     ###########
     ## SPACE ##
     ###########
-    all_spaces_full = myModules.get_spaces_all(atlassian_site,user_name,api_token)         # get a dump of all spaces
-    all_spaces_short = []                                                             # initialize list for less detailed list of spaces
-    i = 0
-    for n in all_spaces_full:
-        i = i +1
-        all_spaces_short.append({                                                     # append the list of spaces
-            'space_key' : n['key'],
-            'space_id' : n['id'],
-            'space_name' : n['name'],
-            'homepage_id' : n['homepageId'],
-            'spaceDescription' : n['description'],
-            })
-        if (n['key'] == space_key) or n['key'] == str.upper(space_key) or n['key'] == str.lower(space_key):
-            logging.debug("Found space: " + n['key'])
-            space_id = n['id']
-            space_name = n['name']
-            current_parent = n['homepageId']
-    if confluence_compatible:
-        my_outdir_content = os.path.join(my_outdir_base,space_key)
+    sync_time = datetime.now(timezone.utc)        # saved for the next delta export when everything was exported
+    my_space = myModules.get_space_by_key(atlassian_site,space_key,user_name,api_token)
+    if my_space is None:
+        space_key = None
     else:
-        my_outdir_content = os.path.join(my_outdir_base,f"{space_id}-{space_name}")
-    if not os.path.exists(my_outdir_content):
-        os.mkdir(my_outdir_content)
-    if args.sphinx is False:
-        my_outdir_base = my_outdir_content
+        logging.debug("Found space: " + my_space['key'])
+        space_id = my_space['id']
+        space_name = my_space['name']
+        current_parent = my_space['homepageId']
+        if confluence_compatible:
+            my_outdir_content = os.path.join(my_outdir_base,space_key)
+        else:
+            my_outdir_content = os.path.join(my_outdir_base,f"{space_id}-{space_name}")
+        os.makedirs(my_outdir_content, exist_ok=True)
+        if args.sphinx is False:
+            my_outdir_base = my_outdir_content
 
     #logging.debug("my_outdir_base: " + my_outdir_base)
     #logging.debug("my_outdir_content: " + my_outdir_content)
@@ -264,42 +350,93 @@ elif args.mode == 'space':
         logging.warn("Could not find Space Key in this site")
     else:
         space_title = myModules.get_space_title(atlassian_site,space_id,user_name,api_token)
+        pages_to_export = None          # every page of the space
+        if args.mode == 'delta':
+            if args.since == 'last':
+                since = myModules.read_last_sync(my_outdir_content)
+                if since is None:
+                    raise SystemExit(f"No previous export in {my_outdir_content}, run a space export first or give a time with --since")
+            else:
+                since = args.since
+            logging.info(f"Searching for pages modified since {since.isoformat()}")
+            pages_to_export = list(myModules.iter_pages_modified_since(atlassian_site,space_key,since,user_name,api_token))
+            logging.info(f"{len(pages_to_export)} pages were modified")
         #
-        # get list of pages from space
+        # get list of pages from space, streamed as the results arrive
         #
-        all_pages_full = myModules.get_pages_from_space(atlassian_site,space_id,user_name,api_token)
-        all_pages_short = []
-        i = 0
-        for n in all_pages_full:
-            i = i + 1
-            all_pages_short.append({
+        all_pages_short = ({
                 'page_id' : n['id'],
                 'pageTitle' : n['title'],
                 'parentId' : n['parentId'],
                 'space_id' : n['spaceId'],
+                'version' : n['version']['number'],
                 }
-            )
+            for n in myModules.iter_pages_from_space(atlassian_site,space_id,user_name,api_token))
+        pages_total = "?" if pages_to_export is None else len(pages_to_export)
+        if args.html == True or relative_links or (args.incremental and args.mode == 'space'):
+            # the index, the relative links and the manifest need the whole list before the first export
+            all_pages_full = myModules.get_pages_from_space(atlassian_site,space_id,user_name,api_token)
+            all_pages_short = []
+            for n in all_pages_full:
+                all_pages_short.append({
+                    'page_id' : n['id'],
+                    'pageTitle' : n['title'],
+                    'parentId' : n['parentId'],
+                    'space_id' : n['spaceId'],
+                    'version' : n['version']['number'],
+                    }
+                )
+            if relative_links:
+                space_index = myModules.SpaceIndex(atlassian_site,space_key,all_pages_short,confluence_compatible)
+            if args.incremental and args.mode == 'space':
+                manifest = myModules.ExportManifest(my_outdir_content, export_options)
+                pages_to_export = manifest.changed_pages(all_pages_short, confluence_compatible)
+            pages_total = len(all_pages_short if pages_to_export is None else pages_to_export)
+            logging.debug(f"{pages_total} pages to export")
+        if args.incremental and args.mode == 'delta':
+            # the other pages keep their output, removed pages are found by the next incremental space export
+            manifest = myModules.ExportManifest(my_outdir_content, export_options)
+            manifest.keep_previous()
 
         # Make an index.html file
         if args.html == True:
-            myModules.dump_index_file(all_pages_full, my_outdir_content, space_key, sphinx_compatible, confluence_compatible)
+            page_tree = space_index if space_index is not None else myModules.PageTree(all_pages_short)
+            myModules.dump_index_file(page_tree, my_outdir_content, space_key, sphinx_compatible, confluence_compatible, args.index_json)
 
         # put it all together
-        logging.debug(f"{len(all_pages_short)} pages to export")
-        page_counter = 0
-        for p in all_pages_short:
-            page_counter = page_counter + 1
-            my_body_export_view = myModules.get_body_export_view(atlassian_site,p['page_id'],user_name,api_token).json()
+        def export_space_page(page_counter, p):
+            if 'fetch_error' in p:
+                raise p['fetch_error']
+            my_body_export_view = p['body_export_view']
             my_body_export_view_html = my_body_export_view['body']['export_view']['value']
             my_body_export_view_name = p['pageTitle']
             my_body_export_view_title = p['pageTitle']
             logging.debug("")
-            logging.debug(f"Getting page #{page_counter}/{len(all_pages_short)}, {my_body_export_view_title}, {p['page_id']}")
-            my_body_export_view_labels = myModules.get_page_labels(atlassian_site,p['page_id'],user_name,api_token)
-            #my_body_export_view_labels = ",".join(myModules.get_page_labels(atlassian_site,p['page_id'],user_name,api_token))
+            logging.debug(f"Getting page #{page_counter}/{pages_total}, {my_body_export_view_title}, {p['page_id']}")
+            my_body_export_view_labels = p['labels']
             mypage_url = f"{my_body_export_view['_links']['base']}{my_body_export_view['_links']['webui']}"
             logging.debug(f"dump_html arg sphinx_compatible = {sphinx_compatible}")
-            myModules.dump_html(atlassian_site,space_key,my_body_export_view_html,my_body_export_view_title,p['page_id'],my_outdir_base,my_outdir_content,my_body_export_view_labels,p['parentId'],user_name,api_token,sphinx_compatible,sphinx_tags,arg_html_output=args.html,arg_rst_output=args.rst,arg_space_pages_short=(all_pages_short if relative_links else []),arg_confluence_compatible=confluence_compatible)
+            my_output = myModules.dump_html(atlassian_site,space_key,my_body_export_view_html,my_body_export_view_title,p['page_id'],my_outdir_base,my_outdir_content,my_body_export_view_labels,p['parentId'],user_name,api_token,sphinx_compatible,sphinx_tags,arg_html_output=args.html,arg_rst_output=args.rst,arg_space_index=space_index,arg_confluence_compatible=confluence_compatible,arg_render_executor=render_pool,arg_page=my_body_export_view)
+            if manifest is not None:
+                manifest.record(p, my_output)
+
+        if args.bulk and response_cache is None and pages_to_export is None:
+            # bodies and labels come in batches of pages, straight from the listing
+            page_documents = myModules.get_page_documents_from_space(atlassian_site,space_key,user_name,api_token)
+        else:
+            # bodies and labels are fetched concurrently ahead of the export workers,
+            # the bodies of unchanged pages come from the response cache,
+            # and only the pages that changed since the last export are fetched
+            page_documents = myModules.prefetch_page_documents(atlassian_site,(all_pages_short if pages_to_export is None else pages_to_export),user_name,api_token,args.fetch_concurrency)
+        failed_pages = myModules.export_pages(page_documents, export_space_page, args.workers)
+        if len(failed_pages) > 0:
+            logging.error(f"{len(failed_pages)} pages could not be exported: {', '.join(p['page_id'] for (p,e) in failed_pages)}")
+        if manifest is not None:
+            for (p,e) in failed_pages:
+                manifest.record_failure(p)
+            logging.info(f"Removed {manifest.save()} files of removed, moved or renamed pages")
+        if len(failed_pages) == 0:
+            myModules.write_last_sync(my_outdir_content, sync_time)
     logging.debug("Done!")
 elif args.mode == 'pageprops':
     ###############
@@ -324,6 +461,7 @@ elif args.mode == 'pageprops':
                 'space_id' : n['spaceId'],
                 }
             )
+        space_index = myModules.SpaceIndex(atlassian_site,space_key,all_pages_short,confluence_compatible)
     #
     # Get Page Properties REPORT
     #
@@ -392,8 +530,9 @@ elif args.mode == 'pageprops':
                 arg_html_output=args.html,
                 arg_rst_output=args.rst,
                 arg_show_labels=args.showlabels,
-                arg_space_pages_short=(all_pages_short if relative_links else []),
-                arg_confluence_compatible=confluence_compatible
+                arg_space_index=space_index,
+                arg_confluence_compatible=confluence_compatible,
+                arg_page=my_child_export_view
             )                  # creates html files for every child
     myModules.dump_html(
             arg_site=atlassian_site,
@@ -413,9 +552,18 @@ elif args.mode == 'pageprops':
             arg_html_output=args.html,
             arg_rst_output=args.rst,
             arg_show_labels=args.showlabels,
-            arg_space_pages_short=(all_pages_short if relative_links else []),
-            arg_confluence_compatible=confluence_compatible
+            arg_space_index=space_index,
+            arg_confluence_compatible=confluence_compatible,
+            arg_page=my_report_export_view
         )         # finally creating the HTML for the report page
     logging.info("Done!")
 else:
     logging.error("No script mode defined in the command line")
+myModules.save_attachment_indexes()
+myModules.save_failure_cache()
+logging.info(f"HTTP client: {myModules.get_http_client(user_name,api_token).stats}")
+logging.info(f"Downloads: {myModules.get_download_stats()}")
+if response_cache is not None:
+    logging.info(f"Response cache: {response_cache}")
+if render_pool is not None:
+    render_pool.shutdown()
@@ -40,47 +40,36 @@ if args.page:
     logging.debug(f"Page: {args.page} using Editor: {editor_version}")
 elif args.space:
     space_key = args.space
-    ## get all spaces in order to find the space ID based on the key
-    all_spaces_full = myModules.get_spaces_all(atlassian_site,user_name,api_token)         # get a dump of all spaces
-    all_spaces_short = []                                                             # initialize list for less detailed list of spaces
-    i = 0
-    for n in all_spaces_full:
-        i = i +1
-        all_spaces_short.append({                                                     # append the list of spaces
-            'space_key' : n['key'],
-            'space_id' : n['id'],
-            'space_name' : n['name'],
-            'homepage_id' : n['homepageId'],
-            'spaceDescription' : n['description'],
-            })
-        if (n['key'] == space_key) or n['key'] == str.upper(space_key) or n['key'] == str.lower(space_key):
-            logging.debug("Found space: " + n['key'])
-            space_id = n['id']
-            space_name = n['name']
-            current_parent = n['homepageId']
+    ## find the space ID based on the key
+    my_space = myModules.get_space_by_key(atlassian_site,space_key,user_name,api_token)
+    all_pages_short = []
+    if my_space is None:
+        space_key = None
+    else:
+        logging.debug("Found space: " + my_space['key'])
+        space_id = my_space['id']
+        space_name = my_space['name']
+        current_parent = my_space['homepageId']
 
     if space_key == "" or space_key is None:    # if the supplied space key can't be found
         logging.warn("Could not find Space Key in this site")
+        all_pages_full = []
     else:
         #
-        # get list of pages from space
+        # get list of pages from space, streamed as the results arrive
         #
-        all_pages_full = myModules.get_pages_from_space(atlassian_site,space_id,user_name,api_token)
-        all_pages_short = []
-        i = 0
-        for n in all_pages_full:
-            i = i + 1
-            all_pages_short.append({
-                'page_id' : n['id'],
-                'pageTitle' : n['title'],
-                'parentId' : n['parentId'],
-                'space_id' : n['spaceId'],
-                }
-            )
+        all_pages_full = myModules.iter_pages_from_space(atlassian_site,space_id,user_name,api_token)
     # go through all pages and update short dict
     count_v1 = 0
     count_v2 = 0
-    for my_page in all_pages_short:
+    for n in all_pages_full:
+        my_page = {
+            'page_id' : n['id'],
+            'pageTitle' : n['title'],
+            'parentId' : n['parentId'],
+            'space_id' : n['spaceId'],
+            }
+        all_pages_short.append(my_page)
         try:
             logging.debug(f"Checking page {my_page['pageTitle']} ({my_page['page_id']})")
             page_editor_version = myModules.get_editor_version(atlassian_site,my_page['page_id'],user_name,api_token).json()
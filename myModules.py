@@ -3,8 +3,28 @@ import shutil
 import requests
 import os.path
 import json
+import threading
+import asyncio
+import queue
+import multiprocessing
+import itertools
+import time
+import random
+import sqlite3
+import hashlib
+import heapq
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, parse_qs
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from bs4 import BeautifulSoup as bs
+from bs4 import SoupStrainer
+from bs4 import FeatureNotFound
 import sys
 import pypandoc
 from PIL import Image
@@ -31,6 +51,494 @@ emoticons_dir = "_images/"
 styles_dir = "_static/"
 confluence_css = "confluence.css"
 confluence_css_output = confluence_css
+confluence_index_js = "confluence-index.js"         # script of the index page with a JSON page tree, see dump_index_file
+cache_dir = os.path.join(script_dir, ".cache")      # persistent caches shared between runs
+space_cache_ttl = 24 * 3600                          # seconds a space looked up by key stays cached
+failure_ttl = 24 * 3600                              # seconds a failed external url or host is not tried again
+response_cache_size = 1024 * 1024 * 1024             # bytes of API responses kept in the response cache
+http_pool_size = 10                     # connections kept alive per host
+http_max_rate = 20.0                    # requests per second to the Atlassian site, lowered when throttled
+http_max_retries = 5                    # retries of a GET after a 429, 5xx or connection error
+manifest_file_name = "manifest.json"    # record of the last export, for incremental exports
+last_sync_file_name = "last_sync.json"  # time of the last successful export, for delta mode
+download_chunk_size = 1024 * 1024       # bytes read at a time from a download
+download_workers = 16                   # downloads running at the same time, for all export workers
+download_host_limits = {                # downloads running at the same time per host, by host name suffix
+    ".atlassian.net": 8,
+    ".atlassian.com": 8,                # media hosts the attachment downloads are redirected to
+    }
+download_host_limit = 2                 # downloads running at the same time on any other (external) host
+external_timeout = 10.0                 # seconds to connect to an external host and between two reads
+circuit_breaker_threshold = 3           # failures in a row after which an external host is not tried anymore
+blob_store_dir = None                   # content addressed store the downloaded files are linked from, None to disable
+attachment_index_file_name = ".attachments.json"      # attachments downloaded to a folder, with their version
+attachment_index_save_interval = 5      # seconds between two saves of a changed attachment index
+html_parsers = ["lxml", "html.parser", "html5lib"]      # parsers BeautifulSoup can use, see set_html_parser
+html_parser = "html.parser"             # parser of every page parsed with parse_html
+index_tree_file_name = "index.js"       # page tree loaded by the index page, see dump_index_file
+
+#
+# HTML parser backend, chosen once for every tool
+#
+def set_html_parser(arg_parser):
+    """Choose the parser parse_html uses for all pages
+
+    lxml and html5lib are optional, html.parser is used when their library is not installed.
+    Set it before start_render_pool, the render processes keep the parser they were forked with.
+
+    Args:
+        arg_parser: One of html_parsers
+
+    Returns:
+        the parser used (string)
+    """
+    global html_parser
+    try:
+        bs("", arg_parser)
+    except FeatureNotFound:
+        logging.warning(f"WARNING: The {arg_parser} parser is not installed, using html.parser")
+        arg_parser = "html.parser"
+    html_parser = arg_parser
+    logging.debug(f"HTML parser: {html_parser}")
+    return(html_parser)
+
+def parse_html(arg_html, arg_parse_only=None, **kwargs):
+    """Parse a page, or a file object, with the chosen parser
+
+    Args:
+        arg_html: The HTML, or an open file
+        arg_parse_only: SoupStrainer of the only tags needed, html5lib parses the whole page anyway
+
+    Returns:
+        BeautifulSoup
+    """
+    if html_parser == "html5lib":
+        arg_parse_only = None       # not supported by html5lib, which would warn about it on every page
+    return(bs(arg_html, html_parser, parse_only=arg_parse_only, **kwargs))
+
+def prettify_fragment(arg_soup):
+    """Pretty HTML of a parsed page body
+
+    lxml and html5lib wrap what they parse in html, head and body tags, only what they
+    put in head and body is kept. The parsers still differ where they fix invalid HTML,
+    see the golden pages in tests/fixtures/golden.
+    """
+    if arg_soup.body is None:
+        return(arg_soup.prettify())
+    return("".join([part.decode_contents(indent_level=0) for part in (arg_soup.head, arg_soup.body) if part is not None]))
+
+#
+# Shared HTTP client, every call to the Confluence API goes through it
+#
+class ConnectionStats:
+    """Thread-safe counters for the requests sent and connections opened by a client"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.opened = 0
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_open(self):
+        with self._lock:
+            self.opened += 1
+
+    @property
+    def reused(self):
+        """Requests that were sent on an already open keep-alive connection"""
+        return(max(self.requests - self.opened, 0))
+
+    def __str__(self):
+        return(f"{self.requests} requests, {self.opened} connections opened, {self.reused} reused")
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that reports every request and every new connection to a ConnectionStats"""
+
+    def __init__(self, arg_stats, **kwargs):
+        self.stats = arg_stats              # must exist before HTTPAdapter.__init__ builds the pool manager
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        stats = self.stats
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(self):
+                stats.count_open()
+                return super()._new_conn()
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(self):
+                stats.count_open()
+                return super()._new_conn()
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        self.stats.count_request()
+        return super().send(request, **kwargs)
+
+def get_retry_after(arg_response):
+    """Seconds to wait according to the Retry-After header of a response, None if there is none"""
+    retry_after = arg_response.headers.get("Retry-After")
+    if retry_after is None:
+        return(None)
+    try:
+        return(max(float(retry_after), 0.0))
+    except ValueError:
+        pass
+    try:
+        return(max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0))
+    except (TypeError, ValueError):
+        return(None)
+
+class RateLimiter:
+    """Token bucket shared by every thread, adapting its rate to the Atlassian rate limit responses
+
+    The rate is halved and requests are paused for Retry-After on a 429 or 503, lowered when
+    the X-RateLimit-* headers say the limit is near, and raised again slowly on every success.
+
+    Args:
+        arg_max_rate: Highest rate in requests per second
+        arg_min_rate: Lowest rate in requests per second
+    """
+
+    def __init__(self, arg_max_rate=http_max_rate, arg_min_rate=0.5):
+        self.max_rate = arg_max_rate
+        self.min_rate = min(arg_min_rate, arg_max_rate)
+        self.rate = arg_max_rate
+        self.capacity = max(arg_max_rate, 1.0)        # burst size
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + max(now - self.updated, 0.0) * self.rate)
+                self.updated = max(now, self.updated)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(delay)
+
+    def throttle(self, arg_retry_after=None):
+        """Halve the rate and stop every request for arg_retry_after seconds"""
+        with self._lock:
+            now = time.monotonic()
+            self.rate = max(self.min_rate, self.rate / 2)
+            if arg_retry_after is not None:
+                self.paused_until = max(self.paused_until, now + arg_retry_after)
+            # no tokens are saved up while paused, so the requests don't all resume at once
+            self.tokens = 0.0
+            self.updated = max(now, self.paused_until)
+        logging.debug(f"Throttled, rate lowered to {self.rate:.1f} requests/s" + (f", paused for {arg_retry_after:.1f}s" if arg_retry_after else ""))
+
+    def update_from_response(self, arg_response):
+        if arg_response.status_code in (429, 503):
+            self.throttle(get_retry_after(arg_response))
+            return
+        headers = arg_response.headers
+        near_limit = headers.get("X-RateLimit-NearLimit", "").lower() == "true"
+        try:
+            near_limit = near_limit or int(headers["X-RateLimit-Remaining"]) < 0.1 * int(headers["X-RateLimit-Limit"])
+        except (KeyError, ValueError):
+            pass
+        with self._lock:
+            if near_limit:
+                self.rate = max(self.min_rate, self.rate * 0.8)
+            else:
+                self.rate = min(self.max_rate, self.rate + 0.1)
+
+class ResponseCache:
+    """Persistent cache of API responses in SQLite, keyed by URL
+
+    Entries are revalidated with If-None-Match / If-Modified-Since, or not requested at all when the
+    caller knows the current version number of the page. The least recently used entries are evicted
+    when the cache grows beyond arg_max_size bytes.
+
+    Args:
+        arg_path: Path of the SQLite database file
+        arg_max_size: Size limit of the cached bodies in bytes
+    """
+
+    cached_headers = ("Content-Type", "ETag", "Last-Modified")
+
+    def __init__(self, arg_path, arg_max_size=response_cache_size):
+        self.path = arg_path
+        self.max_size = arg_max_size
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(arg_path, check_same_thread=False)
+        with self._lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, headers TEXT, "
+                "content BLOB, version INTEGER, size INTEGER, accessed REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, arg_url):
+        """The cached entry of an URL as a dict with headers, content and version, None if not cached"""
+        with self._lock:
+            row = self.connection.execute("SELECT headers, content, version FROM responses WHERE url = ?", (arg_url,)).fetchone()
+        if row is None:
+            return(None)
+        return({"headers": json.loads(row[0]), "content": row[1], "version": row[2]})
+
+    def touch(self, arg_url, arg_counter):
+        """Mark an entry as used, counting it as one of the 'hits' or 'revalidated' responses"""
+        with self._lock, self.connection:
+            self.connection.execute("UPDATE responses SET accessed = ? WHERE url = ?", (time.time(), arg_url))
+            setattr(self, arg_counter, getattr(self, arg_counter) + 1)
+
+    def put(self, arg_url, arg_response, arg_version=None):
+        headers = {k: arg_response.headers[k] for k in self.cached_headers if k in arg_response.headers}
+        content = arg_response.content
+        with self._lock, self.connection:
+            self.misses += 1
+            row = self.connection.execute("SELECT size FROM responses WHERE url = ?", (arg_url,)).fetchone()
+            self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (arg_url, json.dumps(headers), content, arg_version, len(content), time.time()))
+            self.size += len(content) - (row[0] if row is not None else 0)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """Delete the least recently used entries down to 90% of max_size, called with the lock held"""
+        evicted = []
+        for (url, size) in self.connection.execute("SELECT url, size FROM responses ORDER BY accessed").fetchall():
+            if self.size <= self.max_size * 0.9:
+                break
+            evicted.append((url,))
+            self.size -= size
+        self.connection.executemany("DELETE FROM responses WHERE url = ?", evicted)
+        logging.debug(f"Evicted {len(evicted)} responses from the response cache")
+
+    def response(self, arg_url, arg_entry):
+        """Turn a cache entry back into a requests Response"""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = arg_url
+        response.headers = requests.structures.CaseInsensitiveDict(arg_entry['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers) or 'utf-8'
+        response._content = arg_entry['content']
+        return(response)
+
+    def __str__(self):
+        return(f"{self.hits} served from cache, {self.revalidated} revalidated, {self.misses} fetched, {self.size // 1024} KB cached")
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+class ConfluenceClient:
+    """Pooled keep-alive HTTP client for the Confluence API
+
+    Requests to the Confluence site go through a shared RateLimiter, and GETs that fail with
+    a 429, a 5xx or a connection error are retried with jittered exponential backoff.
+
+    Args:
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_pool_size: Number of connections kept alive per host
+        arg_headers: Default headers sent with every request
+        arg_max_rate: Highest rate in requests per second to the Confluence site
+        arg_max_retries: Number of retries of a failed GET
+    """
+
+    retry_statuses = (429, 500, 502, 503, 504)
+    backoff_base = 1.0                  # seconds
+    backoff_max = 60.0
+
+    def __init__(self, arg_username, arg_api_token, arg_pool_size=http_pool_size, arg_headers=None,
+            arg_max_rate=http_max_rate, arg_max_retries=http_max_retries):
+        self.auth = (arg_username, arg_api_token)
+        self.pool_size = arg_pool_size
+        self.max_retries = arg_max_retries
+        self.rate_limiter = RateLimiter(arg_max_rate)
+        self.response_cache = None          # a ResponseCache, see enable_response_cache()
+        self.stats = ConnectionStats()
+        self.session = requests.Session()
+        adapter = CountingHTTPAdapter(self.stats, pool_connections=arg_pool_size, pool_maxsize=arg_pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": "confluenceDumpWithPython"})
+        if arg_headers is not None:
+            self.session.headers.update(arg_headers)
+
+    def backoff(self, arg_attempt):
+        """Full jitter exponential backoff, in seconds"""
+        return(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** arg_attempt)))
+
+    def get(self, arg_url, arg_authenticated=True, arg_cache_version=None, **kwargs):
+        """GET an url, with the Confluence credentials unless arg_authenticated is False (external hosts)
+
+        API responses go through the response cache when there is one. A cached response is
+        returned without any request when arg_cache_version matches the version it was stored with.
+
+        Returns:
+            response: The first successful response, or the last one once the retries are used up
+        """
+        if arg_authenticated:
+            kwargs.setdefault("auth", self.auth)
+        kwargs.setdefault("timeout", 30)
+        cache = self.response_cache
+        if (cache is None or not arg_authenticated or kwargs.get("stream")
+                or ("/rest/api/" not in arg_url and "/api/v2/" not in arg_url)):
+            return(self._get(arg_url, arg_authenticated, **kwargs))
+
+        cached = cache.get(arg_url)
+        if cached is not None:
+            if arg_cache_version is not None and cached['version'] == arg_cache_version:
+                cache.touch(arg_url, "hits")
+                return(cache.response(arg_url, cached))
+            headers = dict(kwargs.get("headers") or {})
+            if "ETag" in cached['headers']:
+                headers["If-None-Match"] = cached['headers']["ETag"]
+            if "Last-Modified" in cached['headers']:
+                headers["If-Modified-Since"] = cached['headers']["Last-Modified"]
+            kwargs["headers"] = headers
+        response = self._get(arg_url, arg_authenticated, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            cache.touch(arg_url, "revalidated")
+            return(cache.response(arg_url, cached))
+        if response.status_code == 200:
+            cache.put(arg_url, response, arg_cache_version)
+        return(response)
+
+    def retries(self, arg_authenticated):
+        """Number of retries of a request, external hosts (not authenticated) are retried once"""
+        return(self.max_retries if arg_authenticated else min(1, self.max_retries))
+
+    def _get(self, arg_url, arg_authenticated, **kwargs):
+        max_retries = self.retries(arg_authenticated)
+        for attempt in itertools.count():
+            if arg_authenticated:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.get(arg_url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                logging.debug(f"Retrying in {delay:.1f}s after {e!r}: {arg_url}")
+            else:
+                if arg_authenticated:
+                    self.rate_limiter.update_from_response(response)
+                if response.status_code not in self.retry_statuses or attempt >= max_retries:
+                    return(response)
+                retry_after = get_retry_after(response)
+                delay = retry_after if retry_after is not None else self.backoff(attempt)
+                logging.debug(f"Retrying in {delay:.1f}s after HTTP {response.status_code}: {arg_url}")
+                response.close()
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+_http_client = None
+_http_client_lock = threading.Lock()
+_outdirs_lock = threading.Lock()
+_download_locks = {}                    # target file path: [lock held while the file is downloaded, threads using it]
+
+class DownloadLock:
+    """Lock of a target file path, held while the file is downloaded
+
+    A lock only stays in _download_locks while threads hold it or wait for it, so the table does
+    not grow with the number of files of the run.
+    """
+    def __init__(self, arg_file_path):
+        self.file_path = arg_file_path
+
+    def __enter__(self):
+        with _http_client_lock:
+            entry = _download_locks.setdefault(self.file_path, [threading.Lock(), 0])
+            entry[1] += 1
+        self.lock = entry[0]
+        self.lock.acquire()
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+        with _http_client_lock:
+            entry = _download_locks[self.file_path]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _download_locks[self.file_path]
+
+def user_cache_key(arg_username):
+    """Key of the cached content of a user, the API only returns what the user is allowed to see"""
+    return(hashlib.sha256(arg_username.encode('utf-8')).hexdigest()[:16])
+
+def enable_response_cache(arg_username, arg_api_token, arg_cache_dir=None, arg_max_size=None):
+    """Keep the API responses of the shared client in an on-disk cache, shared between runs
+
+    Every user has a cache of their own, the API only returns what the user is allowed to see.
+
+    Args:
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_cache_dir: Folder of the persistent caches (optional, default cache_dir)
+        arg_max_size: Size limit of the cached responses in bytes (optional, default response_cache_size)
+
+    Returns:
+        ResponseCache: The cache now used by the shared client
+    """
+    global cache_dir
+    if arg_cache_dir is not None:
+        cache_dir = arg_cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    client = get_http_client(arg_username, arg_api_token)
+    if client.response_cache is not None:
+        client.response_cache.close()
+    client.response_cache = ResponseCache(os.path.join(cache_dir, f"responses-{user_cache_key(arg_username)}.sqlite"),
+        response_cache_size if arg_max_size is None else arg_max_size)
+    return(client.response_cache)
+
+def get_http_client(arg_username, arg_api_token, arg_pool_size=None, arg_headers=None, arg_max_rate=None, arg_max_retries=None):
+    """Get the shared ConfluenceClient, creating it on first use or when the credentials or settings change
+
+    Args:
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_pool_size: Number of connections kept alive per host (optional)
+        arg_headers: Default headers sent with every request (optional)
+        arg_max_rate: Highest rate in requests per second to the Confluence site (optional)
+        arg_max_retries: Number of retries of a failed GET (optional)
+
+    Returns:
+        ConfluenceClient: The client shared by every function in this module
+    """
+    global _http_client
+    global http_pool_size
+    global http_max_rate
+    global http_max_retries
+    with _http_client_lock:
+        if arg_pool_size is not None:
+            http_pool_size = arg_pool_size
+        if arg_max_rate is not None:
+            http_max_rate = arg_max_rate
+        if arg_max_retries is not None:
+            http_max_retries = arg_max_retries
+        if (_http_client is None or _http_client.auth != (arg_username, arg_api_token)
+                or _http_client.pool_size != http_pool_size or _http_client.rate_limiter.max_rate != http_max_rate
+                or _http_client.max_retries != http_max_retries or arg_headers is not None):
+            if _http_client is not None:
+                _http_client.close()
+            _http_client = ConfluenceClient(arg_username, arg_api_token, http_pool_size, arg_headers, http_max_rate, http_max_retries)
+        return(_http_client)
 
 def set_variables(arg_page_id = None, arg_confluence_compatible = False):
     """Set variables for export folders"""
@@ -77,21 +585,612 @@ def mk_outdirs(arg_outdir="output", arg_page_id = None, arg_confluence_compatibl
     if arg_confluence_compatible and arg_page_id is not None:
         outdir_attach = outdir_list[0] = f"{outdir_attach}{arg_page_id}/"
         
-    if not os.path.exists(arg_outdir):
-        os.mkdir(arg_outdir)
+    # exist_ok, as several export workers can create the same folders at once
+    os.makedirs(arg_outdir, exist_ok=True)
+    os.makedirs(outdir_attach, exist_ok=True)
+    os.makedirs(outdir_emoticons, exist_ok=True)
+    os.makedirs(outdir_styles, exist_ok=True)
 
-    if not os.path.exists(outdir_attach):
-        os.makedirs(outdir_attach)
+    with _outdirs_lock:
+        if not os.path.exists(outdir_styles + '/' + confluence_css_output):
+            shutil.copy(f"{script_dir}/styles/{confluence_css}", f"{outdir_styles}/{confluence_css_output}")
+    return(outdir_list)
 
-    if not os.path.exists(outdir_emoticons):
-        os.makedirs(outdir_emoticons)
+def write_file_atomic(arg_file_path, arg_content):
+    """Write bytes to a temporary file and rename it, so other workers never see a partial file"""
+    tmp_file_path = f"{arg_file_path}.{threading.get_ident()}.tmp"
+    with open(tmp_file_path, 'wb') as file:
+        file.write(arg_content)
+    os.replace(tmp_file_path, arg_file_path)
 
-    if not os.path.exists(outdir_styles):
-        os.makedirs(outdir_styles)
+def download_file(arg_url, arg_file_path, arg_username, arg_api_token, arg_authenticated=True, arg_size=None, arg_timeout=30, arg_version=None, arg_replace=False):
+    """Stream a download to a .part file in chunks, check its length and rename it to arg_file_path
 
-    if not os.path.exists(outdir_styles + '/' + confluence_css_output):
-        shutil.copy(f"{script_dir}/styles/{confluence_css}", f"{outdir_styles}/{confluence_css_output}")
-    return(outdir_list)
+    Memory use does not depend on the size of the file. Two workers downloading the same file
+    wait for each other, the second one finds the file already there.
+
+    An interrupted download keeps its .part file and a .part.json sidecar with the url, size, version
+    and validators of the file. It is resumed with a Range request, right away after a connection
+    error during the transfer and on the next run otherwise, as long as the sidecar still matches
+    the file. Failed requests are retried by the client.
+
+    Args:
+        arg_url: URL of the file
+        arg_file_path: Local file path
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_authenticated: Send the Confluence credentials, False for external hosts
+        arg_size: Expected size in bytes, ie. the fileSize of an attachment (optional)
+        arg_timeout: Timeout of the connection and of every read, None to wait forever
+        arg_version: Version of the attachment, a .part file of another version is not resumed (optional)
+        arg_replace: Download the file even when it exists, ie. a new version of an attachment
+
+    Returns:
+        size (int): Number of bytes transferred, 0 when the file was already there
+    """
+    with DownloadLock(arg_file_path):
+        if os.path.exists(arg_file_path) and not arg_replace:
+            if arg_size is None or os.path.getsize(arg_file_path) == int(arg_size):
+                return(0)
+            logging.debug(f"Downloading {arg_file_path} again, it does not have the size of the attachment")
+        if arg_size is not None:
+            arg_size = int(arg_size)
+        part_file_path = f"{arg_file_path}.part"
+        sidecar_file_path = f"{part_file_path}.json"
+        client = get_http_client(arg_username, arg_api_token)
+        sidecar = {'url': arg_url, 'size': arg_size, 'version': arg_version}
+        try:
+            with open(sidecar_file_path, encoding='utf-8') as sidecar_file:
+                previous_sidecar = json.load(sidecar_file)
+        except (FileNotFoundError, ValueError):
+            previous_sidecar = {}
+        if all(previous_sidecar.get(k) == v for (k, v) in sidecar.items()):
+            sidecar = previous_sidecar
+        elif os.path.exists(part_file_path):
+            os.remove(part_file_path)           # a .part file of another url, size or version
+        transferred = 0
+        for attempt in itertools.count():
+            offset = os.path.getsize(part_file_path) if os.path.exists(part_file_path) else 0
+            headers = {}
+            if offset > 0:
+                headers['Range'] = f"bytes={offset}-"
+                if 'validator' in sidecar:
+                    headers['If-Range'] = sidecar['validator']      # the whole file comes back if it changed
+                logging.debug(f"Resuming {arg_file_path} at {offset} bytes")
+            body_error = None
+            # the client retries the failed requests, only a connection broken in the body is resumed here
+            with client.get(arg_url, arg_authenticated=arg_authenticated, allow_redirects=True,
+                    stream=True, timeout=arg_timeout, headers=headers) as response:
+                if response.status_code == 416 and offset > 0:
+                    if offset == arg_size:
+                        break           # the .part file was already complete
+                    os.remove(part_file_path)
+                    continue
+                response.raise_for_status()
+                if response.status_code != 206 or not response.headers.get('Content-Range','').startswith(f"bytes {offset}-"):
+                    offset = 0
+                validator = response.headers.get('ETag', response.headers.get('Last-Modified'))
+                if validator is not None and offset == 0:
+                    sidecar['validator'] = validator
+                if arg_size is None and 'Content-Encoding' not in response.headers and 'Content-Length' in response.headers:
+                    arg_size = offset + int(response.headers['Content-Length'])
+                write_file_atomic(sidecar_file_path, json.dumps(sidecar).encode('utf-8'))
+                with open(part_file_path, 'ab' if offset > 0 else 'wb') as part_file:
+                    try:
+                        for chunk in response.iter_content(chunk_size=download_chunk_size):
+                            part_file.write(chunk)
+                            transferred = transferred + len(chunk)
+                    except (requests.exceptions.ChunkedEncodingError, requests.ConnectionError, requests.Timeout) as e:
+                        body_error = e
+            if body_error is None:
+                break
+            if attempt >= client.retries(arg_authenticated):
+                raise body_error
+            delay = client.backoff(attempt)
+            logging.debug(f"Resuming in {delay:.1f}s after {body_error!r}: {arg_url}")
+            time.sleep(delay)
+        size = os.path.getsize(part_file_path)
+        if arg_size is not None and size != arg_size:
+            os.remove(part_file_path)
+            os.remove(sidecar_file_path)
+            raise IOError(f"Downloaded {size} bytes instead of {arg_size}: {arg_url}")
+        os.replace(part_file_path, arg_file_path)
+        os.remove(sidecar_file_path)
+    return(transferred)
+
+class DownloadScheduler:
+    """Shared pool running the downloads of all the export workers
+
+    Downloads run in priority order (lowest first), at most `workers` at a time and at most the
+    limit of their host per host, as the Atlassian hosts take more parallel downloads than
+    external ones. A download waiting for its host does not hold a worker.
+    """
+    def __init__(self, arg_workers=download_workers, arg_host_limits=None, arg_default_host_limit=None):
+        self.workers = arg_workers
+        self.host_limits = download_host_limits if arg_host_limits is None else arg_host_limits
+        self.default_host_limit = download_host_limit if arg_default_host_limit is None else arg_default_host_limit
+        self.jobs = queue.PriorityQueue()
+        self.order = itertools.count()      # submission order within a priority
+        self.lock = threading.Lock()
+        self.running = {}                   # host: number of downloads running
+        self.waiting = {}                   # host: heap of the jobs waiting for the host
+        for i in range(arg_workers):
+            threading.Thread(target=self._work, name=f"download-{i}", daemon=True).start()
+
+    def host_limit(self, arg_host):
+        for (suffix, limit) in self.host_limits.items():
+            if arg_host.endswith(suffix):
+                return(limit)
+        return(self.default_host_limit)
+
+    def submit(self, arg_url, arg_fn, arg_priority=(0, 0)):
+        """Run arg_fn() as a download from the host of arg_url
+
+        Args:
+            arg_url: URL downloaded by arg_fn, for the host limit
+            arg_fn: Function doing the download
+            arg_priority: Tuple, lower runs first
+
+        Returns:
+            Future: The result of arg_fn
+        """
+        future = Future()
+        self.jobs.put((arg_priority, next(self.order), urlparse(arg_url).hostname or "", future, arg_fn))
+        return(future)
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            (priority, order, host, future, fn) = job
+            with self.lock:
+                if self.running.get(host, 0) >= self.host_limit(host):
+                    heapq.heappush(self.waiting.setdefault(host, []), job)
+                    continue
+                self.running[host] = self.running.get(host, 0) + 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn())
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.running[host] = self.running[host] - 1
+                    if self.waiting.get(host):
+                        self.jobs.put(heapq.heappop(self.waiting[host]))
+
+_download_scheduler = None
+
+def get_download_scheduler(arg_workers=None):
+    """The download scheduler shared by all export workers, started on first use"""
+    global _download_scheduler
+    global download_workers
+    with _http_client_lock:
+        if arg_workers is not None and _download_scheduler is None:
+            download_workers = arg_workers
+        if _download_scheduler is None:
+            _download_scheduler = DownloadScheduler(download_workers)
+        return(_download_scheduler)
+
+class SingleFlight:
+    """Coalesce the downloads of the whole run, one transfer per url and per target file
+
+    A download of a file that is already being downloaded, or was downloaded during this run,
+    gets the future of that download. A url that is downloaded to another file is transferred
+    once, the other files are linked (or copied) from the first one. Failed downloads are
+    forgotten, so the next page tries again.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}         # file path: future of the download writing it
+        self.urls = {}          # url: (future, file path) of its first download
+        self.downloads = 0
+        self.shared = 0
+
+    def download(self, arg_url, arg_file_path, arg_download, arg_link):
+        """Future of the download of arg_url to arg_file_path
+
+        Args:
+            arg_url: URL of the file
+            arg_file_path: Local file path
+            arg_download: Function starting the download, returns a future
+            arg_link: Function called as arg_link(file path) to fill arg_file_path from the file another
+                download of the url wrote, in the thread that finished that download
+
+        Returns:
+            Future: The result of the download
+        """
+        file_path = os.path.abspath(arg_file_path)
+        first_future = None
+        with self.lock:
+            future = self.files.get(file_path)
+            if future is not None:
+                self.shared += 1
+                return(future)
+            if arg_url in self.urls:
+                self.shared += 1
+                (first_future, first_file_path) = self.urls[arg_url]
+                future = Future()
+            else:
+                self.downloads += 1
+                future = arg_download()
+                self.urls[arg_url] = (future, file_path)
+            self.files[file_path] = future
+        future.add_done_callback(lambda arg_future: self.forget_failure(arg_url, file_path, arg_future))
+        if first_future is not None:
+            def link(arg_first_future):
+                if arg_first_future.exception() is not None:
+                    future.set_exception(arg_first_future.exception())
+                    return
+                try:
+                    arg_link(first_file_path)
+                    future.set_result(0)
+                except Exception as e:
+                    future.set_exception(e)
+            first_future.add_done_callback(link)        # runs right away when the first download is done
+        return(future)
+
+    def forget_failure(self, arg_url, arg_file_path, arg_future):
+        if arg_future.exception() is None:
+            return
+        with self.lock:
+            if self.files.get(arg_file_path) is arg_future:
+                del self.files[arg_file_path]
+            if self.urls.get(arg_url, (None,))[0] is arg_future:
+                del self.urls[arg_url]
+
+    def __str__(self):
+        return(f"{self.downloads} downloads, {self.shared} shared with another page")
+
+_single_flight = SingleFlight()
+
+def get_download_stats():
+    """Downloads of this run and how many of them were shared"""
+    return(str(_single_flight))
+
+class RecentFailure(IOError):
+    """A download skipped because its url or host failed recently"""
+
+class FailureCache:
+    """External urls and hosts that failed recently, kept between runs
+
+    A failed url is not tried again for `ttl` seconds. After `threshold` failures in a row of a
+    host (connection errors, timeouts or 5xx), the circuit of the host opens: none of its urls
+    are tried until the ttl is over. A success closes it again.
+    """
+    def __init__(self, arg_path=None, arg_ttl=None, arg_threshold=None):
+        self.path = arg_path
+        self.ttl = failure_ttl if arg_ttl is None else arg_ttl
+        self.threshold = circuit_breaker_threshold if arg_threshold is None else arg_threshold
+        self.lock = threading.Lock()
+        self.failures_in_a_row = {}         # host: failures since its last success
+        self.changed = False
+        self.urls = {}                      # url: time until which it is not tried
+        self.hosts = {}                     # host: time until which its circuit is open
+        if arg_path is not None:
+            try:
+                with open(arg_path, encoding='utf-8') as cache_file:
+                    failures = json.load(cache_file)
+                now = time.time()
+                self.urls = {k: v for (k, v) in failures['urls'].items() if v > now}
+                self.hosts = {k: v for (k, v) in failures['hosts'].items() if v > now}
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"WARNING: Ignoring the failure cache {arg_path}: {e!r}")
+
+    def check(self, arg_url):
+        """Raise RecentFailure when arg_url or its host failed recently"""
+        now = time.time()
+        host = urlparse(arg_url).hostname or ""
+        with self.lock:
+            if self.hosts.get(host, 0) > now:
+                raise RecentFailure(f"Host {host} is failing, not trying again before {time.ctime(self.hosts[host])}: {arg_url}")
+            if self.urls.get(arg_url, 0) > now:
+                raise RecentFailure(f"Failed recently, not trying again before {time.ctime(self.urls[arg_url])}: {arg_url}")
+
+    def failure(self, arg_url, arg_exception):
+        host = urlparse(arg_url).hostname or ""
+        host_failure = (isinstance(arg_exception, (requests.ConnectionError, requests.Timeout))
+            or (isinstance(arg_exception, requests.HTTPError) and arg_exception.response is not None
+                and arg_exception.response.status_code >= 500))
+        with self.lock:
+            self.urls[arg_url] = time.time() + self.ttl
+            self.changed = True
+            if host_failure:
+                self.failures_in_a_row[host] = self.failures_in_a_row.get(host, 0) + 1
+                if self.failures_in_a_row[host] >= self.threshold and self.hosts.get(host, 0) <= time.time():
+                    self.hosts[host] = time.time() + self.ttl
+                    logging.warning(f"WARNING: {host} failed {self.failures_in_a_row[host]} times in a row, "
+                        f"not downloading from it for {self.ttl / 3600:.0f} hours")
+
+    def success(self, arg_url):
+        host = urlparse(arg_url).hostname or ""
+        with self.lock:
+            self.failures_in_a_row[host] = 0
+            if self.urls.pop(arg_url, None) is not None or self.hosts.pop(host, None) is not None:
+                self.changed = True
+
+    def save(self):
+        with self.lock:
+            if self.path is None or not self.changed:
+                return
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                write_file_atomic(self.path, json.dumps({'urls': self.urls, 'hosts': self.hosts}, indent=1).encode('utf-8'))
+            except OSError as e:
+                logging.warning(f"WARNING: Could not save the failure cache {self.path}: {e}")
+                return
+            self.changed = False
+
+_failure_cache = None
+
+def get_failure_cache():
+    """The FailureCache of external downloads, in the cache folder"""
+    global _failure_cache
+    with _http_client_lock:
+        if _failure_cache is None:
+            _failure_cache = FailureCache(os.path.join(cache_dir, "failures.json"))
+        return(_failure_cache)
+
+def configure_external_downloads(arg_timeout=None, arg_failure_ttl=None):
+    """Set the timeout of the external downloads and how long a failed url or host is not tried again
+
+    Args:
+        arg_timeout: Seconds to connect and between two reads
+        arg_failure_ttl: Seconds
+    """
+    global external_timeout
+    global failure_ttl
+    if arg_timeout is not None:
+        external_timeout = arg_timeout
+    if arg_failure_ttl is not None:
+        failure_ttl = arg_failure_ttl
+
+def save_failure_cache():
+    if _failure_cache is not None:
+        _failure_cache.save()
+
+def schedule_download(arg_kind, arg_url, arg_file_path, arg_username, arg_api_token, arg_priority=(0, 0), arg_index=None, arg_record=None, **kwargs):
+    """Run download_file() on the download scheduler
+
+    A failed download is logged, result() of the returned future raises its exception.
+    External downloads (arg_authenticated=False) whose url or host failed recently are not
+    tried, they fail right away with RecentFailure, and are only logged in debug.
+
+    Args:
+        arg_kind: What the file is for the log, "attachment", "embed" or "emoticon"
+        arg_url: URL of the file
+        arg_file_path: Local file path
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_priority: Tuple, lower is downloaded first
+        arg_index: AttachmentIndex updated with arg_record once the file is downloaded (optional)
+        arg_record: Index record of the file
+        kwargs: Passed to download_deduplicated()
+
+    Returns:
+        Future: Number of bytes transferred, the download is shared with every page needing the same url or file
+    """
+    failures = None if kwargs.get('arg_authenticated', True) else get_failure_cache()
+
+    def download():
+        try:
+            if failures is not None:
+                failures.check(arg_url)         # again, the host may have failed while this one was queued
+            size = download_deduplicated(arg_url, arg_file_path, arg_username, arg_api_token, **kwargs)
+        except RecentFailure as e:
+            logging.debug(f"Skipping {arg_kind} file {arg_file_path}: {e}")
+            raise
+        except Exception as e:
+            if failures is not None:
+                failures.failure(arg_url, e)
+            logging.warn(f"WARNING: Skipping {arg_kind} file {arg_file_path} due to issues. url: {arg_url}")
+            raise
+        if failures is not None:
+            failures.success(arg_url)
+        if arg_index is not None:
+            arg_index.update(os.path.basename(arg_file_path), arg_record)
+        return(size)
+
+    def link_from(arg_first_file_path):
+        try:
+            link_file(arg_first_file_path, arg_file_path)
+        except Exception:
+            logging.warn(f"WARNING: Skipping {arg_kind} file {arg_file_path} due to issues. url: {arg_url}")
+            raise
+        if arg_index is not None:
+            arg_index.update(os.path.basename(arg_file_path), arg_record)
+
+    if failures is not None:
+        try:
+            failures.check(arg_url)
+        except RecentFailure as e:
+            logging.debug(f"Skipping {arg_kind} file {arg_file_path}: {e}")
+            future = Future()
+            future.set_exception(e)
+            return(future)
+    return(_single_flight.download(arg_url, arg_file_path,
+        lambda: get_download_scheduler().submit(arg_url, download, arg_priority), link_from))
+
+def enable_blob_store(arg_dir):
+    """Keep every downloaded file once, in a content addressed store, and link it where the pages need it
+
+    Args:
+        arg_dir: Folder of the store, on the same file system as the export so files can be hard linked
+    """
+    global blob_store_dir
+    os.makedirs(arg_dir, exist_ok=True)
+    blob_store_dir = arg_dir
+
+def link_file(arg_src_path, arg_dst_path, arg_copy=True):
+    """Make arg_dst_path a hard link of arg_src_path, or a reflink, or a copy when arg_copy is True
+
+    Returns:
+        bool: arg_dst_path has the content of arg_src_path
+    """
+    try:
+        if os.path.samefile(arg_src_path, arg_dst_path):
+            return(True)
+    except OSError:
+        pass
+    tmp_file_path = f"{arg_dst_path}.{threading.get_ident()}.tmp"
+    try:
+        os.link(arg_src_path, tmp_file_path)
+    except OSError:
+        try:
+            import fcntl
+            with open(arg_src_path, 'rb') as src_file, open(tmp_file_path, 'wb') as tmp_file:
+                fcntl.ioctl(tmp_file.fileno(), 0x40049409, src_file.fileno())     # FICLONE, a copy on write clone
+        except (ImportError, OSError):
+            if not arg_copy:
+                if os.path.exists(tmp_file_path):
+                    os.remove(tmp_file_path)
+                return(False)
+            shutil.copyfile(arg_src_path, tmp_file_path)
+    os.replace(tmp_file_path, arg_dst_path)
+    return(True)
+
+def download_deduplicated(arg_url, arg_file_path, arg_username, arg_api_token, arg_file_id=None, **kwargs):
+    """download_file() through the blob store, when it is enabled
+
+    A file with a media file id (attachments) is downloaded once into the store and linked from
+    every page that has it, it is only transferred once. Other files are downloaded, then moved
+    into the store by SHA-256, so equal files are stored once.
+
+    Args:
+        arg_file_id: Media file id of an attachment, the same for all copies of its content (optional)
+        kwargs: Passed to download_file()
+
+    Returns:
+        size (int): Number of bytes transferred
+    """
+    if blob_store_dir is None:
+        return(download_file(arg_url, arg_file_path, arg_username, arg_api_token, **kwargs))
+    if arg_file_id is not None:
+        blob_path = os.path.join(blob_store_dir, "file", remove_illegal_characters(str(arg_file_id)))
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        kwargs.pop('arg_replace', None)         # the content of a file id never changes
+        size = download_file(arg_url, blob_path, arg_username, arg_api_token, **kwargs)
+        link_file(blob_path, arg_file_path)
+        return(size)
+    size = download_file(arg_url, arg_file_path, arg_username, arg_api_token, **kwargs)
+    if size > 0:
+        digest = file_sha256(arg_file_path)
+        blob_path = os.path.join(blob_store_dir, "sha256", digest[:2], digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with DownloadLock(blob_path):
+            if os.path.exists(blob_path):
+                link_file(blob_path, arg_file_path)
+            else:
+                link_file(arg_file_path, blob_path, arg_copy=False)      # a copy would not save anything
+    return(size)
+
+class AttachmentIndex:
+    """Attachments downloaded to a folder, with their id, version, size and media type
+
+    Kept in a .attachments.json file in the folder, so an attachment is only downloaded again when
+    its version changed, without any request for the unchanged ones. Files that are not in the index
+    (ie. downloaded by an older version of this script) are downloaded once more.
+    """
+    def __init__(self, arg_dir):
+        self.path = os.path.join(arg_dir, attachment_index_file_name)
+        self.dir = arg_dir
+        self.lock = threading.Lock()
+        self.changed = False
+        self.saved = time.monotonic()
+        try:
+            with open(self.path, encoding='utf-8') as index_file:
+                self.files = json.load(index_file)
+        except FileNotFoundError:
+            self.files = {}
+        except ValueError as e:
+            logging.warning(f"WARNING: Ignoring the attachment index {self.path}: {e}")
+            self.files = {}
+
+    @staticmethod
+    def record(arg_attachment):
+        """Index record of an attachment from the v1 API"""
+        return({
+            'id': arg_attachment.get('id'),
+            'fileId': arg_attachment.get('extensions',{}).get('fileId'),
+            'version': arg_attachment.get('version',{}).get('number'),
+            'size': arg_attachment.get('extensions',{}).get('fileSize'),
+            'mediaType': arg_attachment.get('extensions',{}).get('mediaType'),
+            })
+
+    def is_current(self, arg_file_name, arg_record):
+        """The file is there, in the version and with the size of arg_record (fields that are None are not compared)"""
+        with self.lock:
+            record = self.files.get(arg_file_name)
+        if record is None or any(v is not None and record.get(k) != v for (k, v) in arg_record.items()):
+            return(False)
+        try:
+            size = os.path.getsize(os.path.join(self.dir, arg_file_name))
+        except OSError:
+            return(False)
+        return(record.get('size') is None or size == record['size'])
+
+    def is_taken(self, arg_file_name, arg_id):
+        """The file is there and is another attachment than the one with id arg_id
+
+        The pages share the attachment folder unless the export is confluence compatible, the first
+        attachment downloaded with a file name keeps it.
+        """
+        with self.lock:
+            record = self.files.get(arg_file_name)
+        if record is None or record.get('id') is None or arg_id is None or record['id'] == arg_id:
+            return(False)
+        return(os.path.exists(os.path.join(self.dir, arg_file_name)))
+
+    def update(self, arg_file_name, arg_record):
+        """Record a downloaded file, the index is saved every few seconds
+
+        A record without an attachment id, ie. of an embedded image, does not replace the record
+        of the attachment, get_attachments keeps that one up to date. Neither does the record of
+        another attachment with the same file name.
+        """
+        with self.lock:
+            owner = self.files.get(arg_file_name, {}).get('id')
+            if owner is not None and arg_record.get('id') != owner:
+                return
+            self.files[arg_file_name] = arg_record
+            self.changed = True
+            if time.monotonic() - self.saved > attachment_index_save_interval:
+                self._save()
+
+    def save(self):
+        with self.lock:
+            if self.changed:
+                self._save()
+
+    def _save(self):
+        write_file_atomic(self.path, json.dumps(self.files, indent=1, sort_keys=True).encode('utf-8'))
+        self.changed = False
+        self.saved = time.monotonic()
+
+_attachment_indexes = {}
+_attachment_indexes_lock = threading.Lock()
+
+def get_attachment_index(arg_dir):
+    """The AttachmentIndex of a folder, loaded once per run"""
+    dir_path = os.path.normpath(arg_dir)
+    with _attachment_indexes_lock:
+        if dir_path not in _attachment_indexes:
+            _attachment_indexes[dir_path] = AttachmentIndex(dir_path)
+        return(_attachment_indexes[dir_path])
+
+def save_attachment_indexes():
+    """Save the changes of every attachment index, at the end of an export"""
+    with _attachment_indexes_lock:
+        indexes = list(_attachment_indexes.values())
+    for index in indexes:
+        index.save()
+
+def get_embed_version(arg_url):
+    """Attachment version in the url of an embedded image, or None"""
+    version = parse_qs(urlparse(arg_url).query).get('version')
+    return(int(version[0]) if version is not None and version[0].isdigit() else None)
 
 def get_space_title(arg_site,arg_space_id,arg_username,arg_api_token):
     """Get Title of a space
@@ -107,55 +1206,285 @@ def get_space_title(arg_site,arg_space_id,arg_username,arg_api_token):
     """
     server_url = (f"https://{arg_site}.atlassian.net/wiki/api/v2/spaces/{arg_space_id}")
 
-    response = requests.get(server_url, auth=(arg_username, arg_api_token),timeout=30).json()['name']
+    response = get_http_client(arg_username, arg_api_token).get(server_url).json()['name']
     return(response)
 
-def get_spaces_all(arg_site,arg_username,arg_api_token):
+def iter_results(arg_server_url,arg_username,arg_api_token,arg_next_url,arg_timeout=30,arg_link_base=False):
+    """Yield the results of a paginated API call while the next page of results is fetched in the background
+
+    Args:
+        arg_server_url: URL of the first page of results
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_next_url: Function returning the URL of the next page from a response, or None after the last one
+        arg_timeout: Timeout of every request
+        arg_link_base: Copy the '_links' base of the response into the '_links' of every item. The v1 API
+            only returns it at the top level of a listing, the web links of the items are relative to it
+
+    Returns:
+        generator: Every item of 'results', as soon as its page of results has arrived
+    """
+    client = get_http_client(arg_username, arg_api_token)
+
+    def get_results(arg_url):
+        response = client.get(arg_url, timeout=arg_timeout)
+        response.raise_for_status()  # raises exception when not a 2xx response
+        return(response.json())
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="pagination") as executor:
+        next_results = executor.submit(get_results, arg_server_url)
+        while next_results is not None:
+            response_json = next_results.result()
+            next_url = arg_next_url(response_json)
+            next_results = executor.submit(get_results, next_url) if next_url is not None else None
+            if arg_link_base:
+                for item in response_json['results']:
+                    item.setdefault('_links', {}).setdefault('base', response_json['_links']['base'])
+            yield from response_json['results']
+
+def next_cursor_url(arg_server_url):
+    """arg_next_url for iter_results() on the cursor paginated v2 API"""
+    def next_url(arg_response_json):
+        if 'next' not in arg_response_json['_links'].keys():
+            return(None)
+        return(f"{arg_server_url}&cursor{arg_response_json['_links']['next'].split('cursor')[1]}")
+    return(next_url)
+
+def next_link_url(arg_site):
+    """arg_next_url for iter_results() on the v1 API, which returns the path of the next page of results"""
+    def next_url(arg_response_json):
+        if 'next' not in arg_response_json['_links']:
+            return(None)
+        return(f"https://{arg_site}.atlassian.net/wiki{arg_response_json['_links']['next']}")
+    return(next_url)
+
+def iter_spaces_all(arg_site,arg_username,arg_api_token):
     server_url = f"https://{arg_site}.atlassian.net/wiki/api/v2/spaces/?limit=250"
-    response = requests.get(server_url, auth=(arg_username,arg_api_token),timeout=30)
-    response.raise_for_status()  # raises exception when not a 2xx response
-    space_list = response.json()['results']
-    while 'next' in response.json()['_links'].keys():
-        cursorserver_url = f"{server_url}&cursor{response.json()['_links']['next'].split('cursor')[1]}"
-        response = requests.get(cursorserver_url, auth=(arg_username,arg_api_token),timeout=30)
-        space_list = space_list + response.json()['results']
-    return(space_list)
+    return(iter_results(server_url,arg_username,arg_api_token,next_cursor_url(server_url)))
 
-def get_pages_from_space(arg_site,arg_space_id,arg_username,arg_api_token):
-    page_list = []
+def get_spaces_all(arg_site,arg_username,arg_api_token):
+    return(list(iter_spaces_all(arg_site,arg_username,arg_api_token)))
+
+_space_cache_lock = threading.Lock()
+
+def get_space_by_key(arg_site,arg_space_key,arg_username,arg_api_token,arg_ttl=None):
+    """Get a space by its key, without listing all the spaces of the site
+
+    The space is cached in cache_dir/spaces.json for arg_ttl seconds (default space_cache_ttl), per user.
+    The space is still looked up when the cache can't be written.
+
+    Args:
+        arg_site: The site name
+        arg_space_key: Key of the space, matched as given, then in upper and lower case
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_ttl: Seconds a cached space stays valid (optional)
+
+    Returns:
+        space (dict): The space as returned by the v2 spaces API, None if there is no such space
+    """
+    ttl = space_cache_ttl if arg_ttl is None else arg_ttl
+    cache_file_path = os.path.join(cache_dir, "spaces.json")
+    cache_key = f"{user_cache_key(arg_username)}/{arg_site}/{arg_space_key}"
+    with _space_cache_lock:
+        try:
+            with open(cache_file_path, encoding='utf-8') as cache_file:
+                space_cache = json.load(cache_file)
+        except (OSError, ValueError):
+            space_cache = {}
+    cached = space_cache.get(cache_key)
+    if cached is not None and time.time() - cached['fetched'] < ttl:
+        return(cached['space'])
+
+    client = get_http_client(arg_username, arg_api_token)
+    space = None
+    for key in dict.fromkeys([arg_space_key, str.upper(arg_space_key), str.lower(arg_space_key)]):
+        response = client.get(f"https://{arg_site}.atlassian.net/wiki/api/v2/spaces?keys={requests.utils.quote(key)}")
+        response.raise_for_status()
+        if len(response.json()['results']) > 0:
+            space = response.json()['results'][0]
+            break
+    if space is None:
+        return(None)
+
+    with _space_cache_lock:
+        space_cache[cache_key] = {"fetched": time.time(), "space": space}
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            write_file_atomic(cache_file_path, json.dumps(space_cache, indent=1).encode('utf-8'))
+        except OSError as e:
+            logging.warning(f"WARNING: Could not save the space cache {cache_file_path}: {e}")
+    return(space)
+
+def iter_pages_from_space(arg_site,arg_space_id,arg_username,arg_api_token):
     server_url = f"https://{arg_site}.atlassian.net/wiki/api/v2/spaces/{arg_space_id}/pages?status=current&limit=250"
-    response = requests.get(server_url, auth=(arg_username,arg_api_token),timeout=30)
-    page_list = response.json()['results']
-    while 'next' in response.json()['_links'].keys():
-        cursorserver_url = f"{server_url}&cursor{response.json()['_links']['next'].split('cursor')[1]}"
-        response = requests.get(cursorserver_url, auth=(arg_username,arg_api_token),timeout=30)
-        page_list = page_list + response.json()['results']
-    return(page_list)
-
-def get_body_export_view(arg_site,arg_page_id,arg_username,arg_api_token):
+    return(iter_results(server_url,arg_username,arg_api_token,next_cursor_url(server_url)))
+
+def get_pages_from_space(arg_site,arg_space_id,arg_username,arg_api_token):
+    return(list(iter_pages_from_space(arg_site,arg_space_id,arg_username,arg_api_token)))
+
+def get_body_export_view(arg_site,arg_page_id,arg_username,arg_api_token,arg_version=None):
+    """Get the export_view of a page, from the response cache when arg_version is the version it was cached with"""
     server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/content/{arg_page_id}?expand=body.export_view"
-    response = requests.get(server_url, auth=(arg_username, arg_api_token))
+    response = get_http_client(arg_username, arg_api_token).get(server_url, arg_cache_version=arg_version, timeout=60)
+    response.raise_for_status()         # a throttled or missing page fails here, not with a KeyError on ['body']
     return(response)
 
+class PageMeta:
+    """Metadata of a page: id, title, space key, space id, parent id, version number and labels"""
+
+    def __init__(self, arg_content):
+        """Build from a /rest/api/content/{id} response expanded with space, version, ancestors and metadata.labels"""
+        self.id = arg_content['id']
+        self.title = arg_content['title']
+        self.space_key = arg_content['space']['key']
+        self.space_id = arg_content['space']['id']
+        ancestors = arg_content.get('ancestors') or []
+        self.parent_id = ancestors[-1]['id'] if len(ancestors) > 0 else None
+        self.version = arg_content['version']['number']
+        self.labels = [l['name'] for l in arg_content['metadata']['labels']['results']]
+
+_page_meta_cache = {}
+_page_meta_lock = threading.Lock()
+
+def get_page_meta(arg_site,arg_page_id,arg_username,arg_api_token):
+    """Get the metadata of a page with a single request, memoized for the rest of the run
+
+    Args:
+        arg_site: The site name
+        arg_page_id: ID of the page
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+
+    Returns:
+        PageMeta: The metadata of the page
+    """
+    cache_key = (arg_site, str(arg_page_id))
+    with _page_meta_lock:
+        if cache_key in _page_meta_cache:
+            return(_page_meta_cache[cache_key])
+    server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/content/{arg_page_id}?expand=space,version,ancestors,metadata.labels"
+    response = get_http_client(arg_username, arg_api_token).get(server_url)
+    response.raise_for_status()
+    page_meta = PageMeta(response.json())
+    with _page_meta_lock:
+        _page_meta_cache[cache_key] = page_meta
+    return(page_meta)
+
 def get_page_name(arg_site,arg_page_id,arg_username,arg_api_token):
-    server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/content/{arg_page_id}"
-    r_pagetree = requests.get(server_url, auth=(arg_username, arg_api_token),timeout=30)
-    return(r_pagetree.json()['id'] + "_" + r_pagetree.json()['title'])
+    page_meta = get_page_meta(arg_site,arg_page_id,arg_username,arg_api_token)
+    return(page_meta.id + "_" + page_meta.title)
 
 def get_page_parent(arg_site,arg_page_id,arg_username,arg_api_token):
-    server_url = f"https://{arg_site}.atlassian.net/wiki/api/v2/pages/{arg_page_id}"
-    response = requests.get(server_url, auth=(arg_username, arg_api_token),timeout=30)
-    return(response.json()['parentId'])
+    return(get_page_meta(arg_site,arg_page_id,arg_username,arg_api_token).parent_id)
 
 def get_page_space_key(arg_site,arg_page_id,arg_username,arg_api_token):
-    server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/content/{arg_page_id}"
-    r_pagetree = requests.get(server_url, auth=(arg_username, arg_api_token),timeout=30)
-    return(r_pagetree.json()['space']['key'])
+    return(get_page_meta(arg_site,arg_page_id,arg_username,arg_api_token).space_key)
 
 def get_page_space_id(arg_site,arg_page_id,arg_username,arg_api_token):
-    server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/content/{arg_page_id}"
-    r_pagetree = requests.get(server_url, auth=(arg_username, arg_api_token),timeout=30)
-    return(r_pagetree.json()['space']['id'])
+    return(get_page_meta(arg_site,arg_page_id,arg_username,arg_api_token).space_id)
+
+def get_page_documents_from_space(arg_site,arg_space_key,arg_username,arg_api_token,arg_limit=50):
+    """List the pages of a space together with their export_view body and labels
+
+    The v2 page listings only return storage or atlas_doc_format bodies, so the v1 content
+    listing is used, which expands export_view and the page metadata for a whole batch of pages.
+
+    Args:
+        arg_site: The site name
+        arg_space_key: Key of the space
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_limit: Number of pages per request
+
+    Returns:
+        generator: Page records like prefetch_page_documents() yields them, one batch of requests at a time
+    """
+    server_url = (f"https://{arg_site}.atlassian.net/wiki/rest/api/content?spaceKey={arg_space_key}&type=page&status=current"
+        f"&expand=body.export_view,space,version,ancestors,metadata.labels&limit={arg_limit}")
+
+    for content in iter_results(server_url,arg_username,arg_api_token,next_link_url(arg_site),arg_timeout=120,arg_link_base=True):
+        page_meta = PageMeta(content)
+        with _page_meta_lock:
+            _page_meta_cache[(arg_site, page_meta.id)] = page_meta
+        yield({
+            'page_id' : page_meta.id,
+            'pageTitle' : page_meta.title,
+            'parentId' : page_meta.parent_id,
+            'space_id' : str(page_meta.space_id),
+            'version' : page_meta.version,
+            'body_export_view' : content,
+            'labels' : ", ".join(page_meta.labels),
+            })
+
+def get_user_time_zone(arg_site,arg_username,arg_api_token):
+    """Time zone of the profile of the user, CQL compares dates in this time zone (UTC if it can't be found)"""
+    server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/user/current"
+    try:
+        response = get_http_client(arg_username, arg_api_token).get(server_url, timeout=30)
+        response.raise_for_status()
+        return(ZoneInfo(response.json()['timeZone']))
+    except Exception as e:
+        logging.warning(f"WARNING: Could not get the time zone of the user, using UTC: {e!r}")
+        return(timezone.utc)
+
+def iter_pages_modified_since(arg_site,arg_space_key,arg_since,arg_username,arg_api_token,arg_limit=50):
+    """Pages of a space modified, or with an attachment modified, after a point in time
+
+    The pages come from a CQL search, the space is not listed. CQL compares dates to the minute,
+    so pages modified in the minute before arg_since are included as well.
+
+    Args:
+        arg_site: The site name
+        arg_space_key: Key of the space
+        arg_since: datetime with a time zone
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_limit: Number of results per request
+
+    Returns:
+        generator: Short page records with 'page_id', 'pageTitle', 'parentId', 'space_id' and 'version', every page once
+    """
+    since = arg_since.astimezone(get_user_time_zone(arg_site,arg_username,arg_api_token)) - timedelta(minutes=1)
+    cql = f'space = "{arg_space_key}" and type in (page, attachment) and lastmodified > "{since:%Y/%m/%d %H:%M}"'
+    server_url = (f"https://{arg_site}.atlassian.net/wiki/rest/api/content/search?cql={requests.utils.quote(cql)}"
+        f"&expand=space,version,ancestors,metadata.labels,container&limit={arg_limit}")
+    logging.debug(f"Searching for {cql}")
+    page_ids = set()
+    for content in iter_results(server_url,arg_username,arg_api_token,next_link_url(arg_site),arg_timeout=60):
+        if content['type'] == 'page':
+            page_meta = PageMeta(content)
+            with _page_meta_lock:
+                _page_meta_cache[(arg_site, page_meta.id)] = page_meta
+        elif content['type'] == 'attachment' and content.get('container',{}).get('type') == 'page':
+            if content['container']['id'] in page_ids:
+                continue
+            page_meta = get_page_meta(arg_site,content['container']['id'],arg_username,arg_api_token)
+        else:
+            continue        # attachments of blog posts
+        if page_meta.id in page_ids:
+            continue
+        page_ids.add(page_meta.id)
+        yield({
+            'page_id' : page_meta.id,
+            'pageTitle' : page_meta.title,
+            'parentId' : page_meta.parent_id,
+            'space_id' : str(page_meta.space_id),
+            'version' : page_meta.version,
+            })
+
+def read_last_sync(arg_outdir):
+    """Time of the last successful export to a folder, or None"""
+    try:
+        with open(os.path.join(arg_outdir, last_sync_file_name), encoding='utf-8') as sync_file:
+            return(datetime.fromisoformat(json.load(sync_file)['last_sync']))
+    except FileNotFoundError:
+        return(None)
+
+def write_last_sync(arg_outdir, arg_sync_time):
+    """Save the time a successful export started, as the starting point of the next delta export"""
+    write_file_atomic(os.path.join(arg_outdir, last_sync_file_name),
+        json.dumps({'last_sync': arg_sync_time.isoformat()}).encode('utf-8'))
 
 def remove_illegal_characters(input):
     return re.sub(r'[^\w_\.\- ]+', '_', input)
@@ -163,41 +1492,57 @@ def remove_illegal_characters(input):
 def remove_illegal_characters_html_file(input):
     return remove_illegal_characters(input.replace("/","-").replace(":","-").replace(" ","_"))
 
-def get_attachments(arg_site,arg_page_id,arg_outdir_attach,arg_username,arg_api_token):
+def get_attachments(arg_site,arg_page_id,arg_outdir_attach,arg_username,arg_api_token,arg_versions=None,arg_pending=None):
+    """Download the attachments of a page that are not current in the attachment index of the folder
+
+    The downloads run on the download scheduler, images and small files first. When arg_pending is
+    given the downloads (futures) are added to it by file path instead of being waited for.
+
+    Returns:
+        list: The file names of all the attachments of the page
+    """
     my_attachments_list = []
-    server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/content/{arg_page_id}?expand=children.attachment"
-    response = requests.get(server_url, auth=(arg_username, arg_api_token),timeout=30)
+    pending = {} if arg_pending is None else arg_pending
+    server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/content/{arg_page_id}?expand=children.attachment.version"
+    response = get_http_client(arg_username, arg_api_token).get(server_url)
     my_attachments = response.json()['children']['attachment']['results']
+    attachment_index = get_attachment_index(arg_outdir_attach)
     for attachment in my_attachments:
         attachment_title = remove_illegal_characters(requests.utils.unquote(attachment['title']).replace(" ","_").replace(":","-"))         # I want attachments without spaces
         attachment_file_path = os.path.join(arg_outdir_attach,attachment_title)
-        if not os.path.exists(attachment_file_path):
+        attachment_record = AttachmentIndex.record(attachment)
+        if attachment_index.is_taken(attachment_title, attachment_record['id']):
+            logging.warning(f"WARNING: Not downloading {attachment_title} of page {arg_page_id}, {arg_outdir_attach} already holds another attachment with that name")
+        elif not attachment_index.is_current(attachment_title, attachment_record):
             logging.debug(f"Downloading: {attachment_title}")
-            try:
-                attachment_url = f"https://{arg_site}.atlassian.net/wiki{attachment['_links']['download']}"
-                request_attachment = requests.get(attachment_url, auth=(arg_username, arg_api_token),allow_redirects=True,timeout=30)
-                open(attachment_file_path, 'wb').write(request_attachment.content)
-            except:
-                logging.warn(f"WARNING: Skipping attachment file {attachment_file_path} due to issues. url: {attachment_url}")
+            attachment_url = f"https://{arg_site}.atlassian.net/wiki{attachment['_links']['download']}"
+            # inline images first, then by size
+            priority = (0 if (attachment_record['mediaType'] or "").startswith("image/") else 1, attachment_record['size'] or 0)
+            pending[os.path.normpath(attachment_file_path)] = schedule_download("attachment", attachment_url, attachment_file_path,
+                arg_username, arg_api_token, arg_priority=priority, arg_size=attachment_record['size'],
+                arg_version=attachment_record['version'], arg_replace=True, arg_index=attachment_index, arg_record=attachment_record,
+                arg_file_id=attachment_record['fileId'])
         my_attachments_list.append(attachment_title)
+        if arg_versions is not None:
+            arg_versions[attachment_file_path] = attachment.get('version',{}).get('number')
+    if arg_pending is None:
+        wait(pending.values())
     return(my_attachments_list)
 
 # get page labels
 def get_page_labels(arg_site,arg_page_id,arg_username,arg_api_token):
-    html_labels = []
-    server_url = f"https://{arg_site}.atlassian.net/wiki/api/v2/pages/{arg_page_id}/labels"
-    response = requests.get(server_url, auth=(arg_username,arg_api_token),timeout=30).json()
-    for l in response['results']:
-        html_labels.append(l['name'])
-        logging.debug(f"Label: {l['name']}")
+    html_labels = get_page_meta(arg_site,arg_page_id,arg_username,arg_api_token).labels
     html_labels = ", ".join(html_labels)
     logging.debug(f"Page labels: {html_labels}")
     return(html_labels)
 
-def get_page_properties_children(arg_site,arg_html,arg_outdir,arg_username,arg_api_token):
+def get_page_properties_children(arg_site,arg_html,arg_outdir,arg_username,arg_api_token,arg_soup=None):
     my_page_properties_children = []
     my_page_properties_children_dict = {}
-    soup = bs(arg_html, "html.parser")
+    if arg_soup is None:
+        soup = parse_html(arg_html)
+    else:
+        soup = arg_soup         # already parsed by the caller, with at least the td tags
     my_page_properties_items = soup.findAll('td',class_="title")
     my_page_properties_items_counter = 0
     for n in my_page_properties_items:
@@ -211,123 +1556,388 @@ def get_page_properties_children(arg_site,arg_html,arg_outdir,arg_username,arg_a
     logging.debug( f"{my_page_properties_items_counter} Page Properties Children Pages")
     return[my_page_properties_children,my_page_properties_children_dict]
 
-def get_editor_version(arg_site,arg_page_id,arg_username,arg_api_token):
-    server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/content/{arg_page_id}?expand=metadata.properties.editor"
-    response = requests.get(server_url, auth=(arg_username, arg_api_token))
-    return(response)
+def get_editor_version(arg_site,arg_page_id,arg_username,arg_api_token):
+    server_url = f"https://{arg_site}.atlassian.net/wiki/rest/api/content/{arg_page_id}?expand=metadata.properties.editor"
+    response = get_http_client(arg_username, arg_api_token).get(server_url)
+    return(response)
+
+#
+# Asynchronous fetch engine, keeps many requests in flight on the shared client
+#
+class AsyncConfluenceFetcher:
+    """Fetch Confluence content with asyncio under a global and per-endpoint concurrency limit
+
+    The requests themselves go through the pooled ConfluenceClient, run on a thread pool
+    as large as the global limit, so no extra HTTP dependency is needed.
+
+    Args:
+        arg_site: The site name
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_concurrency: Maximum number of requests in flight
+        arg_endpoint_limits: Dict overriding the per-endpoint limits of endpoint_limits
+    """
+
+    endpoint_limits = {
+        "export_view": 50,
+        "meta": 50,
+    }
+
+    def __init__(self, arg_site, arg_username, arg_api_token, arg_concurrency=20, arg_endpoint_limits=None):
+        self.site = arg_site
+        self.concurrency = max(arg_concurrency, 1)
+        self.limits = dict(self.endpoint_limits)
+        if arg_endpoint_limits is not None:
+            self.limits.update(arg_endpoint_limits)
+        self.client = get_http_client(arg_username, arg_api_token)
+        self._executor = None
+        self._semaphore = None
+        self._endpoint_semaphores = {}
+
+    async def __aenter__(self):
+        # semaphores are created inside the running loop
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="fetch")
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._endpoint_semaphores = {k: asyncio.Semaphore(v) for k, v in self.limits.items()}
+        return(self)
+
+    async def __aexit__(self, *exc_info):
+        self._executor.shutdown(wait=False)
+
+    async def _run(self, arg_endpoint, arg_function):
+        loop = asyncio.get_running_loop()
+        async with self._endpoint_semaphores[arg_endpoint], self._semaphore:
+            return await loop.run_in_executor(self._executor, arg_function)
+
+    async def get_json(self, arg_endpoint, arg_url, arg_cache_version=None):
+        def get_and_decode():
+            response = self.client.get(arg_url, arg_cache_version=arg_cache_version)
+            response.raise_for_status()
+            return(response.json())         # decoded off the event loop, export_view bodies can be large
+        return await self._run(arg_endpoint, get_and_decode)
+
+    async def get_body_export_view(self, arg_page_id, arg_version=None):
+        server_url = f"https://{self.site}.atlassian.net/wiki/rest/api/content/{arg_page_id}?expand=body.export_view"
+        return await self.get_json("export_view", server_url, arg_version)
+
+    async def get_page_meta(self, arg_page_id):
+        """Like get_page_meta(), sharing its cache"""
+        cache_key = (self.site, str(arg_page_id))
+        with _page_meta_lock:
+            if cache_key in _page_meta_cache:
+                return(_page_meta_cache[cache_key])
+        server_url = f"https://{self.site}.atlassian.net/wiki/rest/api/content/{arg_page_id}?expand=space,version,ancestors,metadata.labels"
+        page_meta = PageMeta(await self.get_json("meta", server_url))
+        with _page_meta_lock:
+            _page_meta_cache[cache_key] = page_meta
+        return(page_meta)
+
+    async def get_page_labels(self, arg_page_id):
+        """Labels of a page, joined like get_page_labels()"""
+        page_meta = await self.get_page_meta(arg_page_id)
+        return(", ".join(page_meta.labels))
+
+    async def get_page_document(self, arg_page):
+        """Copy of a short page record with its export_view body and labels, or the error that prevented it"""
+        document = dict(arg_page)
+        try:
+            (document['body_export_view'], document['labels']) = await asyncio.gather(
+                self.get_body_export_view(arg_page['page_id'], arg_page.get('version')),
+                self.get_page_labels(arg_page['page_id']))
+        except Exception as e:
+            document['fetch_error'] = e
+        return(document)
+
+    async def put_page_documents(self, arg_pages, arg_queue):
+        """Fetch the documents of arg_pages, at most `concurrency` pages at a time, into a queue.Queue"""
+        loop = asyncio.get_running_loop()
+
+        async def fetch_and_put(arg_page):
+            document = await self.get_page_document(arg_page)
+            await loop.run_in_executor(None, arg_queue.put, document)     # blocks while the consumer is behind
+
+        pages = iter(arg_pages)
+        end_of_pages = object()
+        pending = set()
+        # the pages can come from a generator that fetches them, so it runs outside the event loop
+        try:
+            while (page := await loop.run_in_executor(None, next, pages, end_of_pages)) is not end_of_pages:
+                if len(pending) >= self.concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending.add(asyncio.ensure_future(fetch_and_put(page)))
+        finally:
+            # the pages listed before a failure of the listing are still handed over
+            if pending:
+                await asyncio.wait(pending)
+
+def prefetch_page_documents(arg_site, arg_pages, arg_username, arg_api_token, arg_concurrency=20):
+    """Pipeline the body and label fetches of many pages ahead of the export
+
+    Args:
+        arg_site: The site name
+        arg_pages: Short page records with a 'page_id'
+        arg_username: Username for auth
+        arg_api_token: API token for auth
+        arg_concurrency: Maximum number of requests in flight
+
+    Returns:
+        generator: Page records extended with 'body_export_view' and 'labels' (or 'fetch_error'), in completion order.
+            Raises the exception that stopped the fetch, ie. a failed page listing, after the pages fetched before it.
+    """
+    documents = queue.Queue(maxsize=arg_concurrency * 2)
+    end_of_pages = object()
+    errors = []             # exception that stopped the fetch thread
+
+    async def fetch_all():
+        async with AsyncConfluenceFetcher(arg_site, arg_username, arg_api_token, arg_concurrency) as fetcher:
+            await fetcher.put_page_documents(arg_pages, documents)
+
+    def run():
+        try:
+            asyncio.run(fetch_all())
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            documents.put(end_of_pages)
+
+    threading.Thread(target=run, name="prefetch", daemon=True).start()
+    while (document := documents.get()) is not end_of_pages:
+        yield document
+    if len(errors) > 0:
+        raise errors[0]         # the pages after it were never fetched, the export is not complete
+
+def page_html_file_name(arg_title, arg_page_id, arg_confluence_compatible=False):
+    """File name of the exported HTML file of a page"""
+    if arg_confluence_compatible:
+        # Confluence mode adds the page id to the title and replaces spaces with a dash.
+        html_file_name = (f"{arg_title}_{arg_page_id}.html").replace(" ","-").replace("+","-")
+    else:
+        html_file_name = (f"{arg_title}.html")
+    return(remove_illegal_characters_html_file(html_file_name))
+
+class PageTree:
+    """The pages of a space as a tree, built once from the page listing
+
+    Every query walks the tree iteratively, deep spaces don't hit the recursion limit.
+
+    Args:
+        arg_pages: Short page records with 'page_id', 'pageTitle' and 'parentId'
+    """
+    def __init__(self, arg_pages):
+        self.pages = {}         # page id: short page record
+        self.children = {}      # page id: ids of its child pages, in listing order
+        self.roots = []         # pages without a parent, in listing order
+        self.ancestors_cache = {}       # page id: (the page and its ancestors, id of a missing ancestor)
+        for page in arg_pages:
+            if page['page_id'] in self.pages:
+                continue        # the first record wins, as with a search of the list
+            self.pages[page['page_id']] = page
+            if page['parentId'] is None:
+                self.roots.append(page)
+            else:
+                self.children.setdefault(page['parentId'], []).append(page['page_id'])
+
+    def __len__(self):
+        return(len(self.pages))
+
+    def walk(self, arg_page_id, arg_max_depth=None, arg_breadth_first=False):
+        """The page and its descendants, every page before its children
+
+        Args:
+            arg_page_id: Id of the top page
+            arg_max_depth: Levels of descendants, 0 for the page only, None for all of them
+            arg_breadth_first: Level by level instead of branch by branch
+
+        Yields:
+            (page, depth below the top page)
+        """
+        if arg_page_id not in self.pages:
+            return
+        pending = deque([(arg_page_id, 0)])
+        seen = {arg_page_id}        # guards against a loop in the listing
+        while len(pending) > 0:
+            (page_id, depth) = pending.popleft() if arg_breadth_first else pending.pop()
+            yield (self.pages[page_id], depth)
+            if arg_max_depth is None or depth < arg_max_depth:
+                child_ids = [child_id for child_id in self.children.get(page_id, []) if child_id not in seen]
+                seen.update(child_ids)
+                if arg_breadth_first:
+                    pending.extend([(child_id, depth + 1) for child_id in child_ids])
+                else:
+                    pending.extend([(child_id, depth + 1) for child_id in reversed(child_ids)])
+
+    def subtree(self, arg_page_id, arg_max_depth=None):
+        """The page and its descendants, down to arg_max_depth levels, as a list"""
+        return([page for (page, depth) in self.walk(arg_page_id, arg_max_depth)])
+
+    def ancestors(self, arg_page_id):
+        """The page and its ancestors, from the page up to the root of the space
 
-def dump_html(
+        The chains are memoized, so the pages of a branch share the lookups of their parents.
+
+        Returns:
+            (pages (tuple), id of the first ancestor that is not in the space or None)
+        """
+        chain = []
+        page_id = arg_page_id
+        while page_id is not None and page_id not in self.ancestors_cache:
+            page = self.pages.get(page_id)
+            if page is None or page in chain:       # missing page, or a loop in the listing
+                break
+            chain.append(page)
+            page_id = page['parentId']
+        if page_id is None:
+            ancestors = ((), None)
+        elif page_id in self.ancestors_cache:
+            ancestors = self.ancestors_cache[page_id]
+        elif page_id in self.pages:
+            ancestors = ((), None)
+        else:
+            ancestors = ((), page_id)
+        for page in reversed(chain):
+            ancestors = ((page,) + ancestors[0], ancestors[1])
+            self.ancestors_cache[page['page_id']] = ancestors
+        return(ancestors)
+
+class SpaceIndex(PageTree):
+    """The page tree of a space with the names of the exported files, built once per export for the relative links and the breadcrumbs
+
+    Args:
+        arg_site: The site name
+        arg_space_key: Key of the exported space
+        arg_pages: Short page records with 'page_id', 'pageTitle', 'parentId' and 'space_id'
+        arg_confluence_compatible: The pages are exported with confluence compatible file names
+    """
+    def __init__(self, arg_site, arg_space_key, arg_pages, arg_confluence_compatible=False):
+        PageTree.__init__(self, arg_pages)
+        self.file_names = {page_id: page_html_file_name(page['pageTitle'], page_id, arg_confluence_compatible)
+            for (page_id, page) in self.pages.items()}      # page id: name of the exported HTML file
+        # links to the space home page and to the space pages, searched in every exported page
+        self.space_link_search_regex = re.compile(f"{arg_site}.atlassian.net/wiki/spaces/{arg_space_key}/?[\"'#]")
+        self.linked_pages_regex = re.compile(f"/wiki/spaces/{arg_space_key}/pages/([\\d]+)")
+
+    def root(self, arg_space_id):
+        """The first page without a parent in the space with this id, None when there is none"""
+        for page in self.roots:
+            if page['space_id'] == arg_space_id:
+                return(page)
+        return(None)
+
+def fetch_page_assets(
     arg_site,
     arg_space_key,
     arg_html,
     arg_title,
     arg_page_id,
     arg_outdir_base,
-    arg_outdir_content,
-    arg_page_labels,
     arg_page_parent,
     arg_username,
     arg_api_token,
     arg_sphinx_compatible=True,
-    arg_sphinx_tags=False,
     arg_type="",
     arg_html_output=False,
-    arg_rst_output=True,
-    arg_show_labels=False,
-    arg_space_pages_short={},
-    arg_confluence_compatible=False
+    arg_space_index=None,
+    arg_confluence_compatible=False,
+    arg_page=None
     ):
-    """Create HTML and RST files
+    """I/O stage of dump_html: download everything a page needs and look up what render_page can't compute
+
+    Only the img tags of the page are parsed here, the full document is parsed by render_page.
 
     Args:
-        arg_site: Name of the Confluence Site
-        arg_html: HTML Content to use for page
-        arg_title: Title of the page
-        arg_page_id: Page ID
-        arg_outdir_base: Base output folder
-        arg_outdir_content: Output folder for Content
-        arg_page_labels: Labels of the page
-        arg_page_parent: Parent of the page
-        arg_username: Username for authentication
-        arg_api_token: API Token for authentication
-        arg_sphinx_compatible: Place _static and _images folder at root of output folder
-        arg_sphinx_tags: Add tags to output RST
-        arg_type: For Page Properties, the type of page: "report", "child" or "common" if it's not for Page Properties
+        arg_space_index: SpaceIndex of the exported space, for relative links and breadcrumbs (optional)
 
     Returns:
-        HTML, RST and all attachments, embeds and emoticons
+        assets (dict): attachments, final attributes of every img tag, page properties children,
+            page url, breadcrumbs, the file names of the space pages the page links to
+            and of the space home page, the downloaded files of the page with their attachment version and the downloads
+            (futures) still running, the attachments and emoticons the page does not need to wait for
     """
-    my_vars = set_variables()
     my_emoticons_list = []
-    my_outdir_content = arg_outdir_content
-    #my_outdir_content = os.path.join(arg_outdir_base,str(arg_page_id) + "-" + str(arg_title))      # this is for html and rst files
-    if not os.path.exists(my_outdir_content):
-        os.mkdir(my_outdir_content)
-    #myOutdir = os.path.join(arg_outdir,str(arg_page_id) + "-" + str(arg_title))
     my_outdirs = mk_outdirs(arg_outdir_base, arg_page_id, arg_confluence_compatible)        # this is for everything for _images and _static
     my_vars = set_variables(arg_page_id, arg_confluence_compatible)     # create a dict with the 3 folder paths: attach, emoticons, styles
-    
-    
-    soup = bs(arg_html, "html.parser")
-
-    #
-    # removing elements we don't need like
-    # * <div class="expand-control"...
-    # * <pre class="syntaxhighlighter-pre"...
-    #
-    my_undesirables = soup.findAll('div',class_="expand-control")
-    for div in my_undesirables:
-        div.decompose()
+    assets = {}
 
-    # Find all pre tags
-    pre_tags = soup.find_all('pre')
-    # Remove the class 'syntaxhighlighter-pre' from each pre tag
-    for pre in pre_tags:
-        pre['class'] = [c for c in pre.get('class', []) if c != 'syntaxhighlighter-pre']
-
-    # continuing
-    if arg_confluence_compatible:
-        # Confluence mode adds the page id to the title and replaces spaces with a dash.
-        html_file_name = (f"{arg_title}_{arg_page_id}.html").replace(" ","-").replace("+","-")
-    else:
-        html_file_name = (f"{arg_title}.html")
-
-    html_file_name = remove_illegal_characters_html_file(html_file_name)
-    html_file_path = os.path.join(my_outdir_content,html_file_name)
-    my_attachments = get_attachments(arg_site,arg_page_id,str(my_outdirs[0]),arg_username,arg_api_token)
+    assets['downloads'] = {}
+    pending = {}            # local file path: download still running on the download scheduler
+    assets['attachments'] = get_attachments(arg_site,arg_page_id,str(my_outdirs[0]),arg_username,arg_api_token,assets['downloads'],pending)
     #
     # used for pageprops mode
     #
     #if (arg_type == "child"):
         #my_report_children_dict = get_page_properties_children(arg_site,arg_html,arg_outdir,arg_username,arg_api_token)[1]              # get list of all page properties children
         #my_report_children_dict[arg_page_id].update({"Filename": arg_html_file_name})
+    # Only the img tags are needed to download the images, and the td tags for the page
+    # properties children of a report. render_page applies the img attributes by position,
+    # so both soups must keep every img tag in document order.
     if (arg_type == "report"):
-        my_report_children_dict= get_page_properties_children(arg_site,arg_html,my_outdir_content,arg_username,arg_api_token)[1]      # dict
-        my_page_properties_items = soup.findAll('td',class_="title")       # list
-        for item in my_page_properties_items:
-            id = item['data-content-id']
-            item.a['href'] = (f"{my_report_children_dict[id]['Name']}.html")
+        soup = parse_html(arg_html, SoupStrainer(['img','td']))
+    else:
+        soup = parse_html(arg_html, SoupStrainer('img'))
+    assets['report_children'] = None
+    if (arg_type == "report"):
+        assets['report_children'] = get_page_properties_children(arg_site,arg_html,arg_outdir_base,arg_username,arg_api_token,soup)[1]      # dict
     #
     # dealing with "confluence-embedded-image confluence-external-resource"
     #
+    # every image is queued on the download scheduler first, the page only waits for the images
+    # it needs the width of, attachments and emoticons are waited for by dump_html at the end
     my_embeds_externals = soup.findAll('img',class_="confluence-embedded-image confluence-external-resource")
-    my_embeds_externals_counter = 0
-    for embed_ext in my_embeds_externals:
+    my_embeds_externals_downloads = []
+    for (my_embeds_externals_counter, embed_ext) in enumerate(my_embeds_externals):
         orig_embed_external_path = embed_ext['src']     # online link to file
         orig_embed_external_name = orig_embed_external_path.rsplit('/',1)[-1].rsplit('?')[0]      # just the file name
         my_embed_external_name = remove_illegal_characters((f"{arg_page_id}-{my_embeds_externals_counter}-{requests.utils.unquote(orig_embed_external_name)}").replace(" ", "_").replace(":","-"))    # local filename
         my_embed_external_path = os.path.join(my_outdirs[0],my_embed_external_name)        # local filename and path
+        download = None
+        if not os.path.exists(my_embed_external_path):
+            download = schedule_download("embed", orig_embed_external_path, my_embed_external_path, arg_username, arg_api_token,
+                arg_authenticated=False, arg_timeout=external_timeout)
+        my_embeds_externals_downloads.append((embed_ext, my_embed_external_name, my_embed_external_path, download))
+
+    #
+    # dealing with "confluence-embedded-image"
+    #
+    my_embeds = [embed for embed in soup.findAll('img',class_=re.compile("^confluence-embedded-image"))
+        if "confluence-external-resource" not in embed['class']]
+    attachment_index = get_attachment_index(my_outdirs[0])
+    logging.debug(str(len(my_embeds)) + " embedded images.")
+    my_embeds_downloads = []
+    for embed in my_embeds:
+        orig_embed_path = embed['src']        # online link to file
+        orig_embed_name = orig_embed_path.rsplit('/',1)[-1].rsplit('?')[0]      # online file name
+        my_embed_name = remove_illegal_characters(requests.utils.unquote(orig_embed_name).replace(" ", "_"))    # local file name
+        my_embed_path = my_outdirs[0] + my_embed_name                            # local file path
+        # the attachment of the image is usually in the index already, or being downloaded by get_attachments
+        embed_record = {'version': get_embed_version(orig_embed_path)}
+        download = pending.get(os.path.normpath(my_embed_path))
+        if download is not None:
+            pass
+        elif attachment_index.is_taken(my_embed_name, embed.get('data-linked-resource-id')):
+            pass            # another attachment with the same name, get_attachments warned about it
+        elif embed_record['version'] is None:
+            if not os.path.exists(my_embed_path):
+                download = schedule_download("embed", orig_embed_path, my_embed_path, arg_username, arg_api_token)
+        elif not attachment_index.is_current(my_embed_name, embed_record):
+            download = schedule_download("embed", orig_embed_path, my_embed_path, arg_username, arg_api_token,
+                arg_replace=True, arg_index=attachment_index, arg_record=embed_record)
+        if download is not None:
+            pending[os.path.normpath(my_embed_path)] = download
+        my_embeds_downloads.append((embed, my_embed_name, my_embed_path, download))
+
+    for (embed_ext, my_embed_external_name, my_embed_external_path, download) in my_embeds_externals_downloads:
         if arg_sphinx_compatible == True:
             my_embed_external_path_relative = os.path.join(str('../' + my_vars['attach_dir']),my_embed_external_name)
         else:
             my_embed_external_path_relative = os.path.join(my_vars['attach_dir'],my_embed_external_name)
         try:
-            if not os.path.exists(my_embed_external_path):
-                to_download = requests.get(orig_embed_external_path, allow_redirects=True)
-                open(my_embed_external_path,'wb').write(to_download.content)
+            if download is not None:
+                download.result()
+            assets['downloads'].setdefault(my_embed_external_path, None)
             img = Image.open(my_embed_external_path)
         except:
-            logging.warn(f"WARNING: Skipping embed file {my_embed_external_path} due to issues. url: {orig_embed_external_path}")
+            if download is None or download.exception() is None:        # failed downloads are logged already
+                logging.warn(f"WARNING: Skipping embed file {my_embed_external_path} due to issues. url: {embed_ext['src']}")
         else:
             if img is not None:
                 if img.width < 600:
@@ -339,30 +1949,21 @@ def dump_html(
                 embed_ext['onclick'] = f"window.open(\"{my_embed_external_path_relative}\")"
                 embed_ext['src'] = str(my_embed_external_path_relative)
                 embed_ext['data-image-src'] = str(my_embed_external_path_relative)
-                my_embeds_externals_counter = my_embeds_externals_counter + 1
 
-    #
-    # dealing with "confluence-embedded-image"
-    #
-    my_embeds = soup.findAll('img',class_=re.compile("^confluence-embedded-image"))
-    logging.debug(str(len(my_embeds)) + " embedded images.")
-    for embed in my_embeds:
-        orig_embed_path = embed['src']        # online link to file
-        orig_embed_name = orig_embed_path.rsplit('/',1)[-1].rsplit('?')[0]      # online file name
-        my_embed_name = remove_illegal_characters(requests.utils.unquote(orig_embed_name).replace(" ", "_"))    # local file name
-        my_embed_path = my_outdirs[0] + my_embed_name                            # local file path
+    for (embed, my_embed_name, my_embed_path, download) in my_embeds_downloads:
         if arg_sphinx_compatible == True:
             my_embed_path_relative = f"../{my_vars['attach_dir']}{my_embed_name}"
         else:
             my_embed_path_relative = f"{my_vars['attach_dir']}{my_embed_name}"
         img = None
         try:
-            if not os.path.exists(my_embed_path):
-                to_download = requests.get(orig_embed_path, allow_redirects=True, auth=(arg_username, arg_api_token))
-                open(my_embed_path,'wb').write(to_download.content)
+            if download is not None:
+                download.result()
+            assets['downloads'].setdefault(my_embed_path, None)
             img = Image.open(my_embed_path)
         except:
-            logging.warn(f"WARNING: Skipping embed file {my_embed_path} due to issues. url: {orig_embed_path}")
+            if download is None or download.exception() is None:
+                logging.warn(f"WARNING: Skipping embed file {my_embed_path} due to issues. url: {embed['src']}")
         else:
             if img is not None:
                 if img.width < 600:
@@ -386,25 +1987,143 @@ def dump_html(
             my_emoticon_path = f"{my_vars['emoticons_dir']}{my_emoticon_title}"
         if my_emoticon_title not in my_emoticons_list:
             my_emoticons_list.append(my_emoticon_title)
-            logging.debug(f"Getting emoticon: {my_emoticon_title}")
             file_path = os.path.join(my_outdirs[1],remove_illegal_characters(my_emoticon_title))
-            if not os.path.exists(file_path):
-                emoticon_src = emoticon['src']
-                try:
-                    request_emoticons = requests.get(emoticon_src, auth=(arg_username, arg_api_token))
-                    open(file_path, 'wb').write(request_emoticons.content)
-                except:
-                    logging.warn(f"WARNING: Skipping emoticon file {file_path} due to issues. url: {emoticon_src}")
+            if not os.path.exists(file_path):       # pages using it at the same time share one download
+                logging.debug(f"Getting emoticon: {my_emoticon_title}")
+                pending[file_path] = schedule_download("emoticon", emoticon['src'], file_path, arg_username, arg_api_token)
         emoticon['src'] = my_emoticon_path
+    assets['images'] = [dict(img.attrs) for img in soup.find_all('img')]
+    assets['pending'] = list(pending.values())
+
+    # links only need the file names of the pages this page refers to, keeps the render job small
+    assets['space_links'] = None if arg_space_index is None or len(arg_space_index) == 0 else {}
+    assets['space_root'] = None
+    if arg_html_output and assets['space_links'] is not None and f"/wiki/spaces/{arg_space_key}" in arg_html:
+        if arg_space_index.space_link_search_regex.search(arg_html):
+            space_root = arg_space_index.root(str(get_page_space_id(arg_site,arg_page_id,arg_username,arg_api_token)))
+            if space_root is not None:
+                assets['space_root'] = arg_space_index.file_names[space_root['page_id']]
+        for page_id in set(arg_space_index.linked_pages_regex.findall(arg_html)):
+            if page_id in arg_space_index.file_names:
+                assets['space_links'][page_id] = arg_space_index.file_names[page_id]
+
+    if arg_page is None:
+        arg_page = get_body_export_view(arg_site,arg_page_id,arg_username,arg_api_token).json()
+    assets['page_url'] = f"{arg_page['_links']['base']}{arg_page['_links']['webui']}"
+
+    # Create breadcrumbs
+    breadcrumbs = []
+    if arg_confluence_compatible and arg_page_parent is not None and assets['space_links'] is not None:
+        (ancestors, missing_id) = arg_space_index.ancestors(arg_page_parent)
+        for space_page in ancestors:
+            breadcrumbs.append({"name": space_page['pageTitle'], "url": arg_space_index.file_names[space_page['page_id']]})
+        if missing_id is not None:
+            logging.warn(f"WARNING: Could not find parent page with id {missing_id} for breadcrumbs")
+    assets['breadcrumbs'] = breadcrumbs
+    return(assets)
+
+class DomRewriter:
+    """Rewrite a parsed page in a single walk of the tree
+
+    Handlers are registered for a tag name, optionally only for the tags having a class,
+    and are called in document order, parents before their children. The tree is walked
+    once whatever the number of handlers, instead of one find_all per rewrite.
+    """
+    def __init__(self):
+        self.handlers = {}      # tag name: list of (class or None, handler)
+
+    def add(self, arg_tag, arg_handler, arg_class=None):
+        """Register a handler
+
+        Args:
+            arg_tag: Name of the tags to call the handler for
+            arg_handler: Called with the tag, returns True when it removed the tag from the tree,
+                its children are not visited then
+            arg_class: Only call the handler for the tags having this class
+        """
+        self.handlers.setdefault(arg_tag, []).append((arg_class, arg_handler))
+
+    def rewrite(self, arg_soup):
+        """Walk the tree once, calling the handlers of every tag
+
+        Returns:
+            number of tags visited (int)
+        """
+        visited = 0
+        stack = list(reversed(arg_soup.contents))
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.name is None:       # text, comments
+                continue
+            visited = visited + 1
+            removed = False
+            for (tag_class, handler) in self.handlers.get(node.name, []):
+                if tag_class is None or tag_class in node.get('class', []):
+                    if handler(node):
+                        removed = True
+                        break
+            if not removed:
+                stack.extend(reversed(node.contents))
+        return(visited)
+
+def page_rewriter(arg_site, arg_space_key, arg_title, arg_page_id, arg_assets, arg_type="", arg_html_output=False):
+    """The DomRewriter of render_page, with the handlers rewriting the images, code blocks, report and links of a page
+
+    A rewriter is used for one page, its img handler consumes the img attributes of arg_assets.
+
+    Args:
+        arg_assets: What fetch_page_assets returned for the page
+
+    Returns:
+        DomRewriter: The rewriter to run on the parsed page
+    """
+    my_space_links = arg_assets['space_links']
+    rewriter = DomRewriter()
+
+    # downloaded images, emoticons and their sizes, in the same order as fetch_page_assets found them
+    my_images_attrs = iter(arg_assets['images'])
+    def set_image_attrs(img):
+        img_attrs = next(my_images_attrs, None)
+        if img_attrs is not None:
+            img.attrs = img_attrs
+    rewriter.add('img', set_image_attrs)
+
+    #
+    # removing elements we don't need like
+    # * <div class="expand-control"...
+    # * <pre class="syntaxhighlighter-pre"...
+    #
+    def remove_undesirable(div):
+        for img in div.find_all('img'):         # keep the img attributes lined up with the img tags
+            next(my_images_attrs, None)
+        div.decompose()
+        return(True)
+    rewriter.add('div', remove_undesirable, arg_class="expand-control")
+
+    # Remove the class 'syntaxhighlighter-pre' from each pre tag
+    def clean_pre(pre):
+        pre['class'] = [c for c in pre.get('class', []) if c != 'syntaxhighlighter-pre']
+    rewriter.add('pre', clean_pre)
+
+    if (arg_type == "report"):
+        my_report_children_dict = arg_assets['report_children']
+        def link_report_child(item):
+            id = item['data-content-id']
+            item.a['href'] = (f"{my_report_children_dict[id]['Name']}.html")
+        rewriter.add('td', link_report_child, arg_class="title")
 
     # dealing with 'a' hrefs. Only when exporting to HTML.
     if arg_html_output:
-        for a in soup.findAll('a', href=True):
+        # Handle both /pages/id and /pages/id/title, and also include the uri fragment (#div).
+        page_link_regex = re.compile(f".*{arg_site}.atlassian.net/wiki/spaces/{arg_space_key}/pages/([\d]*)(?:#(.*))?(?:/(.*))?")
+        space_link_regex = re.compile(f".*{arg_site}.atlassian.net/wiki/spaces/{arg_space_key}/?$")
+        def rewrite_link(a):
+            if 'href' not in a.attrs:
+                return
             href = a['href']
             
             if f'{arg_site}.atlassian.net' in href:
-                # Handle both /pages/id and /pages/id/title, and also include the uri fragment (#div).
-                match = re.match(f".*{arg_site}.atlassian.net/wiki/spaces/{arg_space_key}/pages/([\d]*)(?:#(.*))?(?:/(.*))?", href)
+                match = page_link_regex.match(href)
                 if match:
                     id = match.group(1)
                     fragment = match.group(2)
@@ -413,42 +2132,21 @@ def dump_html(
                     if id == arg_page_id:
                         # The current page only needs the uri fragment if it exists, otherwise the href will be '#'.
                         href = "#" + (fragment or "")
-                    elif len(arg_space_pages_short) > 0:
+                    elif my_space_links is not None:
                         # Find the page from the space collection:
-                        found = False
-                        for space_page in arg_space_pages_short:
-                            page_id = space_page['page_id']
-                            page_title = space_page['pageTitle']
-                            if page_id == id:
-                                found = True
-                                # Update the href to the page format and remove the illegal characters for replaced links.
-                                if arg_confluence_compatible:
-                                    href = (f"{page_title}_{page_id}.html").replace(" ","-").replace("+","-")
-                                else:
-                                    href = page_title + ".html"
-                                href = remove_illegal_characters_html_file(href)
-                                # Add the URI fragment if it is defined.
-                                if fragment is not None:
-                                    href += "#" + fragment
-                                break
-                        if not found:
+                        if id in my_space_links:
+                            # Update the href to the page format and remove the illegal characters for replaced links.
+                            href = my_space_links[id]
+                            # Add the URI fragment if it is defined.
+                            if fragment is not None:
+                                href += "#" + fragment
+                        else:
                             logging.warn(f"WARNING: href not found for page {page} in {arg_title}: {href}")
-                elif len(arg_space_pages_short) > 0 and re.match(f".*{arg_site}.atlassian.net/wiki/spaces/{arg_space_key}/?$", href):
+                elif my_space_links is not None and space_link_regex.match(href):
                     # Handle space link.
-                    space_id = str(get_page_space_id(arg_site,arg_page_id,arg_username,arg_api_token));
-                    found = False
-                    for space_page in arg_space_pages_short:
-                        if space_page['parentId'] is None and space_page['space_id'] == space_id:
-                            found = True
-                            page_id = space_page['page_id']
-                            page_title = space_page['pageTitle']
-                            if arg_confluence_compatible:
-                                href = (f"{page_title}_{page_id}.html").replace(" ","-").replace("+","-")
-                            else:
-                                href = page_title + ".html"
-                            href = remove_illegal_characters_html_file(href)
-                            break
-                    if not found:
+                    if arg_assets['space_root'] is not None:
+                        href = arg_assets['space_root']
+                    else:
                         logging.warn(f"WARNING: space page not found in page {arg_title} ({arg_page_id}): {href}")
                 else: # match == None
                     logging.warn(f"WARNING: invalid href found in page {arg_title} ({arg_page_id}): {href}")
@@ -456,9 +2154,44 @@ def dump_html(
                 logging.info(f"INFO: external href found in page {arg_title}_{arg_page_id}: {href}")
                 
             a['href'] = href
+        rewriter.add('a', rewrite_link)
+
+    return(rewriter)
+
+def render_page(
+    arg_site,
+    arg_space_key,
+    arg_html,
+    arg_title,
+    arg_page_id,
+    arg_page_labels,
+    arg_page_parent,
+    arg_assets,
+    arg_sphinx_compatible=True,
+    arg_sphinx_tags=False,
+    arg_type="",
+    arg_html_output=False,
+    arg_rst_output=True,
+    arg_show_labels=False,
+    arg_confluence_compatible=False
+    ):
+    """CPU stage of dump_html: rewrite the page HTML and convert it to RST
+
+    Does no network or file I/O, all arguments can be sent to a process pool.
+
+    Args:
+        arg_assets: What fetch_page_assets returned for the page
+
+    Returns:
+        html_document (string), rst_document (string, None when no RST is wanted or pandoc failed)
+    """
+    my_vars = set_variables(arg_page_id, arg_confluence_compatible)     # create a dict with the 3 folder paths: attach, emoticons, styles
+    my_attachments = arg_assets['attachments']
 
-    my_body_export_view = get_body_export_view(arg_site,arg_page_id,arg_username,arg_api_token).json()
-    page_url = f"{my_body_export_view['_links']['base']}{my_body_export_view['_links']['webui']}"
+    soup = parse_html(arg_html)
+    page_rewriter(arg_site, arg_space_key, arg_title, arg_page_id, arg_assets, arg_type, arg_html_output).rewrite(soup)
+
+    page_url = arg_assets['page_url']
     if arg_sphinx_compatible == True:
         styles_dir_relative = f"../{my_vars['styles_dir']}"
     else:
@@ -477,30 +2210,7 @@ def dump_html(
     )
     myFooter = ""
     
-    # Create breadcrumbs
-    breadcrumbs = []
-    if arg_confluence_compatible and arg_page_parent is not None and len(arg_space_pages_short) > 0:
-        parent_id = arg_page_parent
-        while parent_id is not None:
-            found = False
-            for space_page in arg_space_pages_short:
-                page_id = space_page['page_id']
-                page_title = space_page['pageTitle']
-                if page_id == parent_id:
-                    if arg_confluence_compatible:
-                        page_link = (f"{page_title}_{page_id}.html").replace(" ","-").replace("+","-")
-                    else:
-                        page_link = page_title + ".html"
-                    page_link = remove_illegal_characters_html_file(page_link)
-                    breadcrumbs.append({"name": page_title, "url": page_link})
-                    found = True
-                    break
-            if not found:
-                logging.warn(f"WARNING: Could not find parent page with id {parent_id} for breadcrumbs")
-                break
-            else:
-                parent_id = space_page['parentId']
-
+    breadcrumbs = arg_assets['breadcrumbs']
     if arg_confluence_compatible:
         breadcrumbs_html = "".join([('<li class="first">' if i == 0 else '<li>') + f"<span><a href=\"{x['url']}\">{x['name']}</a></span></li>" for i,x in reversed(list(enumerate(breadcrumbs)))])
         my_header += (f"<body class=\"theme-default aui-theme-default\">\n"
@@ -540,6 +2250,7 @@ def dump_html(
         attach_dir = "../" + my_vars['attach_dir']
     else:
         attach_dir = my_vars['attach_dir']
+    my_pre_footer = ""
     if len(my_attachments) > 0:
         my_pre_footer = "<h2>Attachments</h2><ol>"
         for attachment in my_attachments:
@@ -549,88 +2260,343 @@ def dump_html(
     #
     # Putting HTML together
     #
-    pretty_html = soup.prettify()
-    html_file = open(html_file_path, 'w', encoding='utf-8')
-    html_file.write(my_header)
-    html_file.write(pretty_html)
-    if len(my_attachments) > 0:
-        html_file.write(my_pre_footer)
-    html_file.write(myFooter)
-    html_file.close()
-    if arg_html_output == True:
-        logging.info(f"Exported HTML file {html_file_path}")
+    pretty_html = prettify_fragment(soup)
+    html_document = my_header + pretty_html + my_pre_footer + myFooter
     #
     # convert html to rst
     #
     if not arg_rst_output:
-        return
-    
-    rst_file_name = f"{html_file_name.replace('html','rst')}"
-    rst_file_path = os.path.join(my_outdir_content,rst_file_name)
+        return(html_document, None)
+
     try:
-        output_rst = pypandoc.convert_file(str(html_file_path), 'rst', format='html',extra_args=['--standalone','--wrap=none','--list-tables'])
+        output_rst = pypandoc.convert_text(html_document, 'rst', format='html',extra_args=['--standalone','--wrap=none','--list-tables'])
     except:
         logging.warn("There was an issue generating an RST file from the page.")
+        return(html_document, None)
+    ##
+    ## RST Header with Page Metadata
+    ##
+    if (arg_sphinx_compatible == True):
+        rst_page_header = (f":conf_pagetype: {arg_type}\n"
+            f":conf_pageid: {arg_page_id}\n"
+            f":conf_parent: {arg_page_parent}\n"
+            f":conf_labels: {arg_page_labels}\n"
+            f":doc_title: {arg_title}\n"
+            f"\n"
+        )
     else:
-        ##
-        ## RST Header with Page Metadata
-        ##
-        if (arg_sphinx_compatible == True):
-            rst_page_header = (f":conf_pagetype: {arg_type}\n"
-                f":conf_pageid: {arg_page_id}\n"
-                f":conf_parent: {arg_page_parent}\n"
-                f":conf_labels: {arg_page_labels}\n"
-                f":doc_title: {arg_title}\n"
-                f"\n"
-            )
-        else:
-            rst_page_header = (f".. meta::\n"
-                f"    :confluencePageId: {arg_page_id} \n"
-                f"    :confluencePageLabels: {arg_page_labels} \n"
-                f"    :confluencePageParent: {arg_page_parent} \n"
-                f"\n"
-            )
-        ## Footer with list of page labels
-        if arg_show_labels == True:
-            footer_rst = (f"...."
-                f"\n"
-                f"\n**Page labels**: {arg_page_labels} \n")
-        else:
-            footer_rst = ""
+        rst_page_header = (f".. meta::\n"
+            f"    :confluencePageId: {arg_page_id} \n"
+            f"    :confluencePageLabels: {arg_page_labels} \n"
+            f"    :confluencePageParent: {arg_page_parent} \n"
+            f"\n"
+        )
+    ## Footer with list of page labels
+    if arg_show_labels == True:
+        footer_rst = (f"...."
+            f"\n"
+            f"\n**Page labels**: {arg_page_labels} \n")
+    else:
+        footer_rst = ""
+    return(html_document, rst_page_header + output_rst + footer_rst)
+
+def dump_html(
+    arg_site,
+    arg_space_key,
+    arg_html,
+    arg_title,
+    arg_page_id,
+    arg_outdir_base,
+    arg_outdir_content,
+    arg_page_labels,
+    arg_page_parent,
+    arg_username,
+    arg_api_token,
+    arg_sphinx_compatible=True,
+    arg_sphinx_tags=False,
+    arg_type="",
+    arg_html_output=False,
+    arg_rst_output=True,
+    arg_show_labels=False,
+    arg_space_index=None,
+    arg_confluence_compatible=False,
+    arg_render_executor=None,
+    arg_page=None
+    ):
+    """Create HTML and RST files
+
+    Args:
+        arg_site: Name of the Confluence Site
+        arg_html: HTML Content to use for page
+        arg_title: Title of the page
+        arg_page_id: Page ID
+        arg_outdir_base: Base output folder
+        arg_outdir_content: Output folder for Content
+        arg_page_labels: Labels of the page
+        arg_page_parent: Parent of the page
+        arg_username: Username for authentication
+        arg_api_token: API Token for authentication
+        arg_sphinx_compatible: Place _static and _images folder at root of output folder
+        arg_sphinx_tags: Add tags to output RST
+        arg_type: For Page Properties, the type of page: "report", "child" or "common" if it's not for Page Properties
+        arg_space_index: SpaceIndex of the exported space, to make the links to its pages relative and add breadcrumbs (optional)
+        arg_render_executor: Executor (ie. a ProcessPoolExecutor) running the HTML transformation and RST conversion (optional)
+        arg_page: The export_view document already fetched for the page, or any dict with its '_links' base and webui.
+            Without it the page is fetched again only to build the original URL (optional)
+
+    Returns:
+        HTML, RST and all attachments, embeds and emoticons.
+        output (dict): 'files', the HTML and RST files written, 'downloads', the attachment and embed
+            files of the page with their attachment version, and 'links', the ids of the space pages it links to
+    """
+    my_outdir_content = arg_outdir_content
+    #my_outdir_content = os.path.join(arg_outdir_base,str(arg_page_id) + "-" + str(arg_title))      # this is for html and rst files
+    os.makedirs(my_outdir_content, exist_ok=True)
+    #myOutdir = os.path.join(arg_outdir,str(arg_page_id) + "-" + str(arg_title))
+    html_file_name = page_html_file_name(arg_title, arg_page_id, arg_confluence_compatible)
+    html_file_path = os.path.join(my_outdir_content,html_file_name)
 
-        rst_file = open(rst_file_path, 'w', encoding='utf-8')
-        rst_file.write(rst_page_header)
-        rst_file.write(output_rst)
-        rst_file.write(footer_rst)
-        rst_file.close()
+    my_assets = fetch_page_assets(arg_site,arg_space_key,arg_html,arg_title,arg_page_id,arg_outdir_base,
+        arg_page_parent,arg_username,arg_api_token,arg_sphinx_compatible,arg_type,arg_html_output,
+        arg_space_index,arg_confluence_compatible,arg_page)
+    pending_downloads = my_assets.pop('pending')        # attachments and emoticons, the page does not need them
+    render_args = (arg_site,arg_space_key,arg_html,arg_title,arg_page_id,arg_page_labels,arg_page_parent,
+        my_assets,arg_sphinx_compatible,arg_sphinx_tags,arg_type,arg_html_output,arg_rst_output,
+        arg_show_labels,arg_confluence_compatible)
+    if arg_render_executor is None:
+        (html_document, rst_document) = render_page(*render_args)
+    else:
+        (html_document, rst_document) = arg_render_executor.submit(render_page, *render_args).result()
+
+    output = {'files': [], 'downloads': my_assets['downloads'],
+        'links': sorted(set(re.findall(f"/wiki/spaces/{arg_space_key}/pages/([\\d]+)", arg_html)))}
+    if arg_html_output == True or rst_document is None:
+        # the HTML file is also kept when there is no RST file
+        with open(html_file_path, 'w', encoding='utf-8') as html_file:
+            html_file.write(html_document)
+        output['files'].append(html_file_path)
+        if arg_html_output == True:
+            logging.info(f"Exported HTML file {html_file_path}")
+    if rst_document is not None:
+        rst_file_name = f"{html_file_name.replace('html','rst')}"
+        rst_file_path = os.path.join(my_outdir_content,rst_file_name)
+        with open(rst_file_path, 'w', encoding='utf-8') as rst_file:
+            rst_file.write(rst_document)
+        output['files'].append(rst_file_path)
         logging.info(f"Exported RST file: {rst_file_path}")
-        if arg_html_output == False:
-            os.remove(html_file_path)
+    wait(pending_downloads)
+    return(output)
+
+def export_pages(arg_pages, arg_export_page, arg_workers=1):
+    """Export pages one by one, or on a bounded thread pool
+
+    Args:
+        arg_pages: The pages to export (any iterable, consumed lazily)
+        arg_export_page: Function called as arg_export_page(page_counter, page) for every page
+        arg_workers: Number of pages exported at the same time
+
+    Returns:
+        failures (list): (page, exception) for every page that could not be exported
+    """
+    failures = []
+
+    def export_one(arg_page_counter, arg_page):
+        try:
+            arg_export_page(arg_page_counter, arg_page)
+        except Exception as e:
+            logging.error(f"ERROR: Could not export page {arg_page.get('page_id')} ({arg_page.get('pageTitle')}): {e!r}")
+            failures.append((arg_page, e))
+
+    if arg_workers <= 1:
+        for page_counter, page in enumerate(arg_pages, 1):
+            export_one(page_counter, page)
+        return(failures)
+
+    with ThreadPoolExecutor(max_workers=arg_workers, thread_name_prefix="export") as executor:
+        in_flight = set()
+        for page_counter, page in zip(itertools.count(1), arg_pages):
+            if len(in_flight) >= arg_workers * 2:       # keep the queue short, the pages can come from a generator
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            in_flight.add(executor.submit(export_one, page_counter, page))
+        wait(in_flight)
+    return(failures)
+
+def start_render_pool(arg_processes):
+    """Start a process pool for render_page, so the HTML transformation and RST conversion use every core
+
+    The export workers stay threads for the network and file I/O and hand every page to this pool.
+
+    Args:
+        arg_processes: Number of processes, 0 disables the pool
+
+    Returns:
+        ProcessPoolExecutor, or None when disabled or when processes can't be forked
+    """
+    if arg_processes <= 0:
+        return(None)
+    if "fork" not in multiprocessing.get_all_start_methods():
+        # spawned processes would re-run the calling script
+        logging.warning("WARNING: A render process pool needs the 'fork' start method, rendering in the export workers instead")
+        return(None)
+    executor = ProcessPoolExecutor(max_workers=arg_processes, mp_context=multiprocessing.get_context("fork"))
+    executor.submit(int).result()           # fork the processes now, before any export or fetch thread exists
+    return(executor)
+
+def file_sha256(arg_file_path):
+    """SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(arg_file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return(digest.hexdigest())
+
+class ExportManifest:
+    """Record of an export in its output folder, so the next run only exports what changed
+
+    For every page it keeps the version, title and parent from the page listing, the HTML and RST
+    files with their SHA-256, the attachment and embed files with their attachment version and
+    SHA-256, and the space pages it links to. The paths are relative to the output folder.
+    A manifest written with other export options is ignored, everything is exported again.
+    """
+    def __init__(self, arg_outdir, arg_options=None):
+        self.outdir = arg_outdir
+        self.path = os.path.join(arg_outdir, manifest_file_name)
+        self.options = arg_options or {}
+        self.previous = {}      # page id: record, from the last export
+        self.pages = {}         # page id: record, for this export
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, encoding='utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            logging.info(f"No export manifest in {arg_outdir}, exporting every page")
+        except ValueError as e:
+            logging.warning(f"WARNING: Ignoring the export manifest {self.path}: {e}")
+        else:
+            if manifest.get('options') == self.options:
+                self.previous = manifest['pages']
+            else:
+                logging.info("The export options changed since the last export, exporting every page")
+
+    def files(self, arg_record):
+        """Output files of a page record, relative to the output folder"""
+        return(itertools.chain(arg_record['files'], arg_record['downloads']))
+
+    def changed_pages(self, arg_pages, arg_breadcrumbs=False):
+        """Pages of a listing that have to be exported, the records of the others are kept for this export
+
+        A page is exported when it is new, has a new version, title or parent, misses an output file,
+        links to a page that was renamed, moved or removed, or shows such a page in its breadcrumbs.
+
+        Args:
+            arg_pages: Short page records with 'page_id', 'pageTitle', 'parentId' and 'version'
+            arg_breadcrumbs: The pages show the titles of their ancestors
+
+        Returns:
+            list: The page records to export, in listing order
+        """
+        pages = {p['page_id']: p for p in arg_pages}
+        moved = set(page_id for (page_id, record) in self.previous.items()
+            if page_id not in pages or record['title'] != pages[page_id]['pageTitle']
+                or record['parentId'] != pages[page_id]['parentId'])
+
+        def has_moved_ancestor(arg_page):
+            ancestors = set()
+            parent_id = arg_page['parentId']
+            while parent_id in pages and parent_id not in ancestors:       # stops on a loop in the listing
+                if parent_id in moved:
+                    return(True)
+                ancestors.add(parent_id)
+                parent_id = pages[parent_id]['parentId']
+            return(False)
+
+        changed_pages = []
+        for p in pages.values():
+            record = self.previous.get(p['page_id'])
+            if (record is None or record['version'] != p.get('version') or p['page_id'] in moved
+                    or not moved.isdisjoint(record['links'])
+                    or (arg_breadcrumbs and has_moved_ancestor(p))
+                    or not all(os.path.exists(os.path.join(self.outdir, f)) for f in self.files(record))):
+                changed_pages.append(p)
+            else:
+                self.pages[p['page_id']] = record
+        removed = len(self.previous.keys() - pages.keys())
+        logging.info(f"{len(changed_pages)} of {len(pages)} pages are new or changed since the last export, {removed} were removed")
+        return(changed_pages)
+
+    def record(self, arg_page, arg_output):
+        """Add an exported page, with the output dict returned by dump_html()"""
+        record = {
+            'version': arg_page.get('version'),
+            'title': arg_page['pageTitle'],
+            'parentId': arg_page['parentId'],
+            'files': {os.path.relpath(f, self.outdir): file_sha256(f) for f in arg_output['files']},
+            'downloads': {os.path.relpath(f, self.outdir): {'version': v, 'sha256': file_sha256(f)}
+                for (f, v) in arg_output['downloads'].items() if os.path.exists(f)},
+            'links': arg_output['links'],
+        }
+        with self.lock:
+            self.pages[arg_page['page_id']] = record
+
+    def keep_previous(self):
+        """Keep the records of every page of the last export, for an export of some pages only"""
+        self.pages = dict(self.previous)
+
+    def record_failure(self, arg_page):
+        """Keep the output of a page that could not be exported, and export it again on the next run"""
+        record = self.previous.get(arg_page['page_id'])
+        if record is not None:
+            with self.lock:
+                self.pages[arg_page['page_id']] = dict(record, version=None)
+
+    def save(self):
+        """Delete the output files that no page of this export has anymore, then write the manifest
+
+        Returns:
+            removed (int): Number of files deleted
+        """
+        with self.lock:
+            kept = set(f for record in self.pages.values() for f in self.files(record))
+            stale = set(f for record in self.previous.values() for f in self.files(record)) - kept
+            removed = 0
+            for file_name in sorted(stale):
+                try:
+                    os.remove(os.path.join(self.outdir, file_name))
+                except FileNotFoundError:
+                    continue
+                logging.info(f"Removed {file_name}, its page was removed, moved or renamed")
+                removed = removed + 1
+            manifest = {'options': self.options, 'pages': self.pages}
+            write_file_atomic(self.path, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+            self.previous = dict(self.pages)
+        return(removed)
 
 def dump_index_file(    
     arg_pages,
     arg_outdir_content,
     arg_title,
     arg_sphinx_compatible,
-    arg_confluence_compatible
+    arg_confluence_compatible,
+    arg_json_tree=False
 ) :    
     """Builds the html index for the given page.
 
+    The index is streamed to the file while walking the page tree, so it takes the same time
+    and memory per page whatever the size of the space.
+
     Args:
-        arg_pages: All pages that are going to be exported.
+        arg_pages: PageTree of all pages that are going to be exported.
         arg_outdir_content: The output folder.
         arg_title: The title of the index page.
         arg_sphinx_compatible: Place _static and _images folder at root of output folder
         arg_confluence_compatible: Boolean indicating the page names are confluence compatible.
+        arg_json_tree: Write the page tree to index.js, that the index page loads and unfolds
+            level by level in the browser with the confluence-index.js script of the styles folder,
+            instead of writing every page in the index page.
     """
     my_vars = set_variables()
     my_outdir_content = arg_outdir_content
 
-    index_list = f""
-    for page in arg_pages:
-        if page['parentId'] is None:        
-            index_list += append_child_pages_to_index_file(page, arg_pages, arg_confluence_compatible)
-
     html_file_path = os.path.join(my_outdir_content,"index.html")
 
     if arg_sphinx_compatible == True:
@@ -647,48 +2613,83 @@ def dump_index_file(
             f"</head>\n"
     )
 
-    html_file = open(html_file_path, 'w', encoding='utf-8')
-    html_file.write(my_header)
-    html_file.write(index_list)
-    html_file.close();
-
+    with open(html_file_path, 'w', encoding='utf-8') as html_file:
+        html_file.write(my_header)
+        if arg_json_tree:
+            write_index_tree(os.path.join(my_outdir_content,index_tree_file_name), arg_pages, arg_confluence_compatible)
+            outdir_styles = os.path.normpath(os.path.join(my_outdir_content, styles_dir_relative))
+            os.makedirs(outdir_styles, exist_ok=True)
+            shutil.copy(f"{script_dir}/styles/{confluence_index_js}", os.path.join(outdir_styles, confluence_index_js))
+            html_file.write(f"<body>\n"
+                f"<div id=\"index\"></div>\n"
+                f"<script src=\"{styles_dir_relative}{confluence_index_js}\"></script>\n"
+                f"<script src=\"{index_tree_file_name}\"></script>\n"
+                f"</body>\n"
+                f"</html>\n")
+        else:
+            write_index_list(html_file, arg_pages, arg_confluence_compatible)
+    logging.info(f"Exported the index of {len(arg_pages)} pages to {html_file_path}")
 
-def append_child_pages_to_index_file(
-        arg_page,
+def write_index_list(
+        arg_file,
         arg_pages,
         arg_confluence_compatible) :
-    
-    """Recursively builds the html index for the given page.
+    """Writes the nested lists of the html index, one page at a time.
 
     Args:
-        arg_page: The page to build the index for.
-        arg_pages: All pages that are going to be exported.
+        arg_file: The open index file.
+        arg_pages: PageTree of all pages that are going to be exported.
         arg_confluence_compatible: Boolean indicating the page names are confluence compatible.
-
-    Returns:
-        response (string): The HTML index content of the passed page.
     """
+    # (page whose list item is open, ids of its children not written yet)
+    stack = [(None, iter([page['page_id'] for page in arg_pages.roots]))]
+    written = set()         # guards against a loop in the listing
+    while len(stack) > 0:
+        (parent_id, child_ids) = stack[-1]
+        page_id = next(child_ids, None)
+        if page_id is None:
+            stack.pop()
+            if parent_id is not None:
+                # close the list item and unordered list.            
+                arg_file.write(f"</li>\n"
+                    f"</ul>\n")
+            continue
+        if page_id in written:
+            continue
+        written.add(page_id)
+        page = arg_pages.pages[page_id]
+        # Get the correct name for the link.
+        html_file_name = page_html_file_name(page['pageTitle'], page_id, arg_confluence_compatible)
+        # Write the unordered list and list item for this page, its child pages go in this list item.
+        arg_file.write(f"<ul>\n"
+            f"<li>\n"
+            f"<a href={html_file_name}>{page['pageTitle']}</a>\n")
+        stack.append((page_id, iter(arg_pages.children.get(page_id, []))))
 
-    # Get the correct name for the link.
-    if arg_confluence_compatible:
-        html_file_name = (f"{arg_page['title']}_{arg_page['id']}.html").replace(" ","-").replace("+","-")
-    else:
-        html_file_name = (f"{arg_page['title']}.html")
+def write_index_tree(
+        arg_file_path,
+        arg_pages,
+        arg_confluence_compatible) :
+    """Writes the page tree loaded by the index page, as compact JSON.
 
-    html_file_name = remove_illegal_characters_html_file(html_file_name)
+    Pages are numbered in index order, each page is [title, html file name, [numbers of its child pages]].
 
-    # Write the unordered list and list item for this page.
-    result = (f"<ul>\n"
-             f"<li>\n"
-             f"<a href={html_file_name}>{arg_page['title']}</a>\n")
-    
-    # recursively write the child pages to this list.
-    for page in arg_pages:
-        if page['parentId'] == arg_page['id']:            
-            result += append_child_pages_to_index_file(page, arg_pages, arg_confluence_compatible)
-
-    # close the list item and unordered list.            
-    result += (f"</li>\n"
-              f"</ul>\n")
-    
-    return result
\ No newline at end of file
+    Args:
+        arg_file_path: Path of the file to write.
+        arg_pages: PageTree of all pages that are going to be exported.
+        arg_confluence_compatible: Boolean indicating the page names are confluence compatible.
+    """
+    numbers = {}            # page id: number of the page in the tree
+    for root in arg_pages.roots:
+        for (page, depth) in arg_pages.walk(root['page_id']):
+            numbers.setdefault(page['page_id'], len(numbers))
+    pages = []
+    for page_id in numbers:         # in number order
+        page = arg_pages.pages[page_id]
+        pages.append([page['pageTitle'], page_html_file_name(page['pageTitle'], page_id, arg_confluence_compatible),
+            [numbers[child_id] for child_id in arg_pages.children.get(page_id, []) if child_id in numbers]])
+    tree = {'roots': [numbers[root['page_id']] for root in arg_pages.roots], 'pages': pages}
+    with open(arg_file_path, 'w', encoding='utf-8') as tree_file:
+        tree_file.write("confluenceIndex(")
+        json.dump(tree, tree_file, separators=(',', ':'), ensure_ascii=False)
+        tree_file.write(");\n")
@@ -0,0 +1,25 @@
+// Builds the index page from the page tree in index.js, the lists of child pages are only built when unfolded
+function confluenceIndex(tree) {
+  function pageList(numbers) {
+    var list = document.createElement("ul");
+    numbers.forEach(function (number) {
+      var page = tree.pages[number], item = document.createElement("li"), link = document.createElement("a");
+      link.href = page[1];
+      link.textContent = page[0];
+      if (page[2].length == 0) {
+        item.appendChild(link);
+      } else {
+        var details = document.createElement("details"), summary = document.createElement("summary");
+        summary.appendChild(link);
+        details.appendChild(summary);
+        details.addEventListener("toggle", function () {
+          if (details.open && details.children.length == 1) details.appendChild(pageList(page[2]));
+        });
+        item.appendChild(details);
+      }
+      list.appendChild(item);
+    });
+    return list;
+  }
+  document.getElementById("index").appendChild(pageList(tree.roots));
+}
@@ -0,0 +1,84 @@
+import io
+import json
+import os.path
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import myModules
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def load_fixture(arg_name):
+    """Content of a file of the fixtures folder, decoded when it is JSON"""
+    with open(os.path.join(fixtures_dir, arg_name), encoding='utf-8') as fixture_file:
+        if arg_name.endswith(".json"):
+            return(json.load(fixture_file))
+        return(fixture_file.read())
+
+class FakeResponse:
+    """The parts of a requests.Response the module uses"""
+    def __init__(self, arg_url, arg_json=None, arg_content=b"", arg_status_code=200):
+        self.url = arg_url
+        self.status_code = arg_status_code
+        self.headers = {}
+        self._json = arg_json
+        self.content = arg_content if arg_json is None else json.dumps(arg_json).encode('utf-8')
+        self.raw = io.BytesIO(self.content)
+
+    def json(self):
+        return(self._json)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise myModules.requests.HTTPError(f"{self.status_code}: {self.url}", response=self)
+
+    def iter_content(self, chunk_size=1):
+        yield self.content
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class FakeApi:
+    """Answers the GETs of the shared ConfluenceClient from a table of url parts, and records them
+
+    Add routes with route(url_part, json=..., content=...), the first route whose url part is
+    in the url answers, any other url gets a 404.
+    """
+    def __init__(self):
+        self.routes = []
+        self.calls = []
+
+    def route(self, arg_url_part, json=None, content=b"", status_code=200):
+        self.routes.append((arg_url_part, json, content, status_code))
+
+    def get(self, arg_url):
+        self.calls.append(arg_url)
+        for (url_part, response_json, content, status_code) in self.routes:
+            if url_part in arg_url:
+                return(FakeResponse(arg_url, response_json, content, status_code))
+        return(FakeResponse(arg_url, arg_status_code=404))
+
+    def count(self, arg_url_part):
+        """Number of GETs of an url containing arg_url_part"""
+        return(len([url for url in self.calls if arg_url_part in url]))
+
+@pytest.fixture
+def fake_api(monkeypatch, tmp_path):
+    """Replace the network with a FakeApi, and give the run caches of the module a clean state"""
+    api = FakeApi()
+    monkeypatch.setattr(myModules.ConfluenceClient, "_get", lambda self, arg_url, arg_authenticated, **kwargs: api.get(arg_url))
+    monkeypatch.setattr(myModules, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(myModules, "_http_client", None)
+    monkeypatch.setattr(myModules, "_page_meta_cache", {})
+    monkeypatch.setattr(myModules, "_attachment_indexes", {})
+    monkeypatch.setattr(myModules, "_failure_cache", None)
+    monkeypatch.setattr(myModules, "_single_flight", myModules.SingleFlight())
+    monkeypatch.setattr(myModules, "blob_store_dir", None)
+    return(api)
@@ -0,0 +1,19 @@
+import myModules
+
+attachment = {'id': 'att5', 'extensions': {'fileId': 'f-1', 'fileSize': 4, 'mediaType': 'image/png'}, 'version': {'number': 2}}
+
+def test_embedded_image_keeps_the_attachment_record(tmp_path):
+    (tmp_path / "a.png").write_bytes(b"1234")
+    index = myModules.AttachmentIndex(str(tmp_path))
+    record = myModules.AttachmentIndex.record(attachment)
+    index.update("a.png", record)
+    index.update("a.png", {'version': 2})
+    assert index.files["a.png"] == record
+    assert index.is_current("a.png", record)
+
+def test_embedded_image_without_attachment_record(tmp_path):
+    (tmp_path / "b.png").write_bytes(b"1234")
+    index = myModules.AttachmentIndex(str(tmp_path))
+    index.update("b.png", {'version': 3})
+    index.save()
+    assert myModules.AttachmentIndex(str(tmp_path)).is_current("b.png", {'version': 3})
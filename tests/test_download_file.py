@@ -0,0 +1,45 @@
+import pytest
+import myModules
+from conftest import FakeResponse
+
+url = "https://site.atlassian.net/wiki/download/attachments/100/a.png"
+
+class BrokenResponse(FakeResponse):
+    """A response whose connection breaks after the first half of the content"""
+    def iter_content(self, chunk_size=1):
+        yield self.content[:len(self.content) // 2]
+        raise myModules.requests.exceptions.ChunkedEncodingError("connection broken")
+
+@pytest.fixture
+def no_delay(monkeypatch):
+    monkeypatch.setattr(myModules.time, "sleep", lambda seconds: None)
+
+def test_broken_transfer_is_resumed(fake_api, monkeypatch, tmp_path, no_delay):
+    content = bytes(range(256)) * 4
+    requests_headers = []
+    def get(self, arg_url, arg_authenticated, **kwargs):
+        requests_headers.append(dict(kwargs['headers']))
+        if 'Range' not in kwargs['headers']:
+            return(BrokenResponse(arg_url, arg_content=content))
+        offset = int(kwargs['headers']['Range'][len("bytes="):-1])
+        response = FakeResponse(arg_url, arg_content=content[offset:], arg_status_code=206)
+        response.headers['Content-Range'] = f"bytes {offset}-{len(content) - 1}/{len(content)}"
+        return(response)
+    monkeypatch.setattr(myModules.ConfluenceClient, "_get", get)
+    file_path = str(tmp_path / "a.png")
+    assert myModules.download_file(url, file_path, "user", "token", arg_size=len(content)) == len(content)
+    assert requests_headers[1]['Range'] == f"bytes={len(content) // 2}-"
+    with open(file_path, 'rb') as downloaded_file:
+        assert downloaded_file.read() == content
+    assert myModules._download_locks == {}
+
+def test_failed_request_is_not_retried_again(fake_api, monkeypatch, tmp_path, no_delay):
+    # ConfluenceClient._get already retried it
+    def get(self, arg_url, arg_authenticated, **kwargs):
+        fake_api.calls.append(arg_url)
+        raise myModules.requests.ConnectionError("no route to host")
+    monkeypatch.setattr(myModules.ConfluenceClient, "_get", get)
+    with pytest.raises(myModules.requests.ConnectionError):
+        myModules.download_file(url, str(tmp_path / "a.png"), "user", "token")
+    assert len(fake_api.calls) == 1
+    assert myModules._download_locks == {}
@@ -0,0 +1,31 @@
+import myModules
+
+page_html = '<p>Hello <a href="https://www.example.com/">external</a></p>'
+page_document = {
+    'id': '100',
+    'title': 'Page T',
+    'body': {'export_view': {'value': page_html}},
+    '_links': {'base': 'https://site.atlassian.net/wiki', 'webui': '/spaces/SP/pages/100/Page+T'},
+}
+no_attachments = {'children': {'attachment': {'results': []}}}
+
+def dump_page(arg_outdir, **kwargs):
+    return(myModules.dump_html("site", "SP", page_html, "Page T", "100", str(arg_outdir), str(arg_outdir),
+        "", "99", "user", "token", arg_html_output=True, arg_rst_output=False, **kwargs))
+
+def test_export_view_is_not_fetched_again_when_passed(fake_api, tmp_path):
+    fake_api.route("expand=children.attachment", json=no_attachments)
+    fake_api.route("expand=body.export_view", json=page_document)
+    output = dump_page(tmp_path, arg_page=page_document)
+    assert fake_api.count("expand=body.export_view") == 0
+    assert fake_api.count("expand=children.attachment") == 1
+    assert len(fake_api.calls) == 1
+    assert len(output['files']) == 1
+    with open(output['files'][0], encoding='utf-8') as html_file:
+        assert "https://site.atlassian.net/wiki/spaces/SP/pages/100/Page+T" in html_file.read()
+
+def test_export_view_is_fetched_once_without_it(fake_api, tmp_path):
+    fake_api.route("expand=children.attachment", json=no_attachments)
+    fake_api.route("expand=body.export_view", json=page_document)
+    dump_page(tmp_path)
+    assert fake_api.count("expand=body.export_view") == 1
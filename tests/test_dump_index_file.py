@@ -0,0 +1,50 @@
+import os.path
+import re
+import shutil
+import subprocess
+import pytest
+import myModules
+
+pages = [
+    {'page_id': "100", 'pageTitle': "Home", 'parentId': None},
+    {'page_id': "101", 'pageTitle': "Child page", 'parentId': "100"},
+    {'page_id': "102", 'pageTitle': "Grandchild", 'parentId': "101"},
+    ]
+
+# just enough of the DOM for confluence-index.js, prints the links of the built lists
+fake_dom = """
+function element(name) {
+  return {name: name, children: [], appendChild: function (child) { this.children.push(child); },
+    addEventListener: function (event, listener) { this.toggle = listener; }};
+}
+var index = element("div");
+var document = {createElement: element, getElementById: function () { return index; }};
+function links(node, depth) {
+  if (node.name == "a") console.log(" ".repeat(depth) + node.textContent + " " + node.href);
+  if (node.name == "details") { node.open = true; node.toggle(); }
+  node.children.forEach(function (child) { links(child, depth + (node.name == "ul" ? 1 : 0)); });
+}
+"""
+
+@pytest.mark.parametrize("sphinx", [False, True])
+def test_index_tree_page_loads_its_scripts(tmp_path, sphinx):
+    outdir_base = str(tmp_path)
+    outdir_content = os.path.join(outdir_base, "content") if sphinx else outdir_base
+    os.makedirs(outdir_content, exist_ok=True)
+    myModules.dump_index_file(myModules.PageTree(pages), outdir_content, "SP", sphinx, False, True)
+    with open(os.path.join(outdir_content, "index.html"), encoding='utf-8') as index_file:
+        scripts = [os.path.join(outdir_content, src) for src in re.findall(r'<script src="([^"]*)">', index_file.read())]
+    assert [os.path.basename(script) for script in scripts] == [myModules.confluence_index_js, myModules.index_tree_file_name]
+    assert all(os.path.exists(script) for script in scripts)
+
+    if shutil.which("node") is None:
+        pytest.skip("node is not installed")
+    program = fake_dom + "".join(open(script, encoding='utf-8').read() for script in scripts) + "links(index, 0);\n"
+    output = subprocess.run(["node", "-e", program], capture_output=True, text=True, check=True).stdout
+    assert output.splitlines() == [" Home Home.html", "  Child page Child_page.html", "   Grandchild Grandchild.html"]
+
+def test_index_list_page_has_no_script(tmp_path):
+    myModules.mk_outdirs(str(tmp_path))
+    myModules.dump_index_file(myModules.PageTree(pages), str(tmp_path), "SP", False, False, False)
+    assert not (tmp_path / "_static" / myModules.confluence_index_js).exists()
+    assert "<script" not in (tmp_path / "index.html").read_text(encoding='utf-8')
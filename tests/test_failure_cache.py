@@ -0,0 +1,9 @@
+import myModules
+
+def test_failures_are_kept_for_the_run_when_the_cache_folder_can_not_be_written(tmp_path, caplog):
+    (tmp_path / "file").write_text("")
+    failures = myModules.FailureCache(str(tmp_path / "file" / "cache" / "failures.json"))
+    failures.failure("https://www.example.com/a.png", myModules.requests.HTTPError("404"))
+    failures.save()
+    assert "Could not save the failure cache" in caplog.text
+    assert "https://www.example.com/a.png" in failures.urls
@@ -0,0 +1,33 @@
+import myModules
+
+def attachment_listing(arg_page_id):
+    """Listing of the page attachments, each page has an image.png attachment of its own"""
+    return({'children': {'attachment': {'results': [{
+        'id': f"att{arg_page_id}",
+        'title': "image.png",
+        'version': {'number': 1},
+        'extensions': {'fileId': f"f{arg_page_id}", 'fileSize': 4, 'mediaType': "image/png"},
+        '_links': {'download': f"/download/attachments/{arg_page_id}/image.png?version=1&api=v2"},
+        }]}}})
+
+def export_both_pages(arg_fake_api, arg_outdir, arg_monkeypatch):
+    """get_attachments of pages 100 and 101 in one run, with the run caches of a new run"""
+    arg_monkeypatch.setattr(myModules, "_attachment_indexes", {})
+    arg_monkeypatch.setattr(myModules, "_single_flight", myModules.SingleFlight())
+    for page_id in ("100", "101"):
+        myModules.get_attachments("site", page_id, arg_outdir, "user", "token")
+    myModules.save_attachment_indexes()
+
+def test_same_named_attachments_of_two_pages(fake_api, tmp_path, monkeypatch):
+    for page_id in ("100", "101"):
+        fake_api.route(f"content/{page_id}?expand=children.attachment", json=attachment_listing(page_id))
+        fake_api.route(f"/download/attachments/{page_id}/", content=page_id.encode('utf-8') + b"!")
+    outdir = str(tmp_path) + "/_images/"
+    (tmp_path / "_images").mkdir()
+    export_both_pages(fake_api, outdir, monkeypatch)
+    assert fake_api.count("/download/") == 1
+    for run in range(2):            # warm runs
+        export_both_pages(fake_api, outdir, monkeypatch)
+        assert fake_api.count("/download/") == 1
+        assert myModules.AttachmentIndex(outdir).files["image.png"]['id'] == "att100"
+        assert (tmp_path / "_images" / "image.png").read_bytes() == b"100!"
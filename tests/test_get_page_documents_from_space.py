@@ -0,0 +1,18 @@
+import myModules
+from conftest import load_fixture
+
+def test_documents_of_a_recorded_listing(fake_api, tmp_path):
+    fake_api.route("/rest/api/content?spaceKey=SP", json=load_fixture("content_list_v1.json"))
+    fake_api.route("expand=children.attachment", json={'children': {'attachment': {'results': []}}})
+    documents = list(myModules.get_page_documents_from_space("site", "SP", "user", "token"))
+    assert [(d['page_id'], d['parentId'], d['version'], d['labels']) for d in documents] == [
+        ('100', None, 4, "home"), ('101', '100', 2, "")]
+
+    # the items of a v1 listing have no base link, dump_html needs it for the original url
+    document = documents[1]['body_export_view']
+    assert document['_links']['base'] == "https://site.atlassian.net/wiki"
+    output = myModules.dump_html("site", "SP", document['body']['export_view']['value'], "Child page", "101",
+        str(tmp_path), str(tmp_path), "", "100", "user", "token", arg_html_output=True, arg_rst_output=False,
+        arg_page=document)
+    with open(output['files'][0], encoding='utf-8') as html_file:
+        assert "https://site.atlassian.net/wiki/spaces/SP/pages/101/Child+page" in html_file.read()
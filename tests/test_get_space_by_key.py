@@ -0,0 +1,18 @@
+import myModules
+
+space = {'id': "7", 'key': "SP", 'name': "Space"}
+
+def test_space_is_cached_per_user(fake_api):
+    fake_api.route("/api/v2/spaces?keys=SP", json={'results': [space]})
+    assert myModules.get_space_by_key("site", "SP", "alice", "token") == space
+    assert myModules.get_space_by_key("site", "SP", "alice", "token") == space
+    assert fake_api.count("/api/v2/spaces") == 1
+    assert myModules.get_space_by_key("site", "SP", "bob", "token") == space
+    assert fake_api.count("/api/v2/spaces") == 2
+
+def test_space_is_found_when_the_cache_folder_can_not_be_written(fake_api, monkeypatch, tmp_path, caplog):
+    fake_api.route("/api/v2/spaces?keys=SP", json={'results': [space]})
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(myModules, "cache_dir", str(tmp_path / "file" / "cache"))
+    assert myModules.get_space_by_key("site", "SP", "alice", "token") == space
+    assert "Could not save the space cache" in caplog.text
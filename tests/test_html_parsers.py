@@ -0,0 +1,45 @@
+import os.path
+import pytest
+import myModules
+from conftest import fixtures_dir, load_fixture
+
+# Golden pages rendered from export_view fixtures with every parser backend. A page is compared
+# with tests/fixtures/golden/<fixture>.<parser>.html when the parser gives a page of its own,
+# with tests/fixtures/golden/<fixture>.html (the html.parser page) otherwise.
+export_views = sorted(os.listdir(os.path.join(fixtures_dir, "export_view")))
+parser_modules = {"html.parser": None, "lxml": "lxml", "html5lib": "html5lib"}
+space_pages = [
+    {'page_id': "100", 'pageTitle': "Home", 'parentId': None, 'space_id': "7"},
+    {'page_id': "101", 'pageTitle': "Child page", 'parentId': "100", 'space_id': "7"},
+    {'page_id': "102", 'pageTitle': "Changelog", 'parentId': "100", 'space_id': "7"},
+    ]
+
+def render(arg_html):
+    """HTML document of the home page of space_pages with arg_html as its export_view"""
+    space_index = myModules.SpaceIndex("site", "SP", space_pages)
+    soup = myModules.parse_html(arg_html, myModules.SoupStrainer('img'))
+    assets = {
+        'attachments': [],
+        'images': [img.attrs for img in soup.find_all('img')],
+        'report_children': None,
+        'page_url': "https://site.atlassian.net/wiki/spaces/SP/pages/100",
+        'breadcrumbs': [],
+        'space_links': {page_id: space_index.file_names[page_id] for page_id in set(space_index.linked_pages_regex.findall(arg_html))},
+        'space_root': space_index.file_names[space_index.root("7")['page_id']],
+        }
+    return(myModules.render_page("site", "SP", arg_html, "Home", "100", "", None, assets,
+        arg_html_output=True, arg_rst_output=False)[0])
+
+def golden_path(arg_export_view, arg_parser):
+    name = os.path.splitext(arg_export_view)[0]
+    parser_path = os.path.join(fixtures_dir, "golden", f"{name}.{arg_parser}.html")
+    return(parser_path if os.path.exists(parser_path) else os.path.join(fixtures_dir, "golden", f"{name}.html"))
+
+@pytest.mark.parametrize("parser", parser_modules)
+@pytest.mark.parametrize("export_view", export_views)
+def test_golden_page(parser, export_view, monkeypatch):
+    if parser_modules[parser] is not None:
+        pytest.importorskip(parser_modules[parser])
+    monkeypatch.setattr(myModules, "html_parser", parser)
+    with open(golden_path(export_view, parser), encoding='utf-8') as golden_file:
+        assert render(load_fixture(os.path.join("export_view", export_view))) == golden_file.read()
@@ -0,0 +1,25 @@
+import pytest
+import myModules
+
+page_meta = {'id': '1', 'title': 'A', 'space': {'key': 'SP', 'id': 7}, 'version': {'number': 1},
+    'ancestors': [], 'metadata': {'labels': {'results': []}}}
+
+def test_documents_of_every_page(fake_api):
+    fake_api.route("expand=body.export_view", json={'body': {'export_view': {'value': '<p>x</p>'}}})
+    fake_api.route("expand=space,version", json=page_meta)
+    pages = [{'page_id': str(n), 'pageTitle': f"Page {n}", 'parentId': None} for n in range(5)]
+    documents = list(myModules.prefetch_page_documents("site", pages, "user", "token", 2))
+    assert sorted(d['page_id'] for d in documents) == [p['page_id'] for p in pages]
+    assert all('fetch_error' not in d for d in documents)
+
+def test_failed_listing_is_raised_after_the_listed_pages(fake_api):
+    fake_api.route("expand=body.export_view", json={'body': {'export_view': {'value': '<p>x</p>'}}})
+    fake_api.route("expand=space,version", json=page_meta)
+    def pages():
+        yield {'page_id': '1', 'pageTitle': 'A', 'parentId': None}
+        raise myModules.requests.ConnectionError("listing failed")
+    documents = []
+    with pytest.raises(myModules.requests.ConnectionError):
+        for document in myModules.prefetch_page_documents("site", pages(), "user", "token", 2):
+            documents.append(document)
+    assert [d['page_id'] for d in documents] == ['1']
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+import myModules
+from conftest import FakeResponse
+
+url = "https://site.atlassian.net/wiki/rest/api/content/100?expand=body.export_view"
+
+def get_as(arg_user):
+    """GET url as arg_user through the response cache, at page version 3"""
+    client = myModules.get_http_client(arg_user, "token")
+    if client.response_cache is None:
+        myModules.enable_response_cache(arg_user, "token")
+    return(client.get(url, arg_cache_version=3))
+
+def test_users_do_not_share_cached_responses(fake_api, monkeypatch):
+    # the API answers what the user is allowed to see
+    monkeypatch.setattr(myModules.ConfluenceClient, "_get",
+        lambda self, arg_url, arg_authenticated, **kwargs: FakeResponse(arg_url, {'user': self.auth[0]}))
+    assert get_as("alice").json() == {'user': "alice"}
+    assert get_as("bob").json() == {'user': "bob"}
+    assert get_as("alice").json() == {'user': "alice"}
+    assert myModules.get_http_client("alice", "token").response_cache.hits == 1
+
+def test_counters_are_exact_with_many_threads(fake_api):
+    fake_api.route("/rest/api/content/100", json={'id': "100"})
+    client = myModules.get_http_client("alice", "token")
+    cache = myModules.enable_response_cache("alice", "token")
+    client.get(url, arg_cache_version=3)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda n: client.get(url, arg_cache_version=3), range(800)))
+    assert (cache.misses, cache.hits) == (1, 800)
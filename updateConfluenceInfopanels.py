@@ -1,13 +1,16 @@
-from bs4 import BeautifulSoup
 import glob, sys
 import argparse
+import myModules
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--folder', type=str, default='output',
                     help='Folder to scan and update the html files', required=True)
 parser.add_argument('--recursive', '-r', action='store_true', default=False,
                     help='Will also scan subfolders', required=False)
+parser.add_argument('--parser', default='html.parser', choices=myModules.html_parsers,
+                    help='Parser of the HTML files, html.parser is used when lxml or html5lib is not installed (default html.parser)', required=False)
 args = parser.parse_args()
+myModules.set_html_parser(args.parser)
 dir = args.folder
 recursive = args.recursive
 
@@ -21,7 +24,7 @@ print("updating dir: {}".format(dir))
 for file in glob.glob(dir +"*.html", recursive = recursive):
     try:
         # Parse the html file with BeautifulSoup.
-        soup = BeautifulSoup(open(file, encoding="utf8"),'html.parser')
+        soup = myModules.parse_html(open(file, encoding="utf8"))
         updatedFile = False
         # Note. Update the note div content with a new class and add a 'span' to act as the image container
         for note in soup.findAll('div',attrs={"class":"panel", "style":"background-color: #EAE6FF;border-color: #998DD9;border-width: 1px;"}):
@@ -1,11 +1,13 @@
 import os
 import logging
 import argparse
-from bs4 import BeautifulSoup
+import myModules
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--folder', type=str, default='output/DM',
                     help='Folder to scan and update the html files', required=True)
+parser.add_argument('--parser', default='html.parser', choices=myModules.html_parsers,
+                    help='Parser of the HTML files, html.parser is used when lxml or html5lib is not installed (default html.parser)')
 parser.add_argument('--loglevel', default='warning',
                     choices=['critical', 'error', 'warning', 'info', 'debug'],
                     help='Provide logging level. Example --loglevel debug, default=warning')
@@ -15,6 +17,7 @@ args = parser.parse_args()
 dir = args.folder
 
 logging.basicConfig(level=args.loglevel.upper(), format=args.logformat)
+myModules.set_html_parser(args.parser)
 
 documentation_directory = os.path.join(os.getcwd(), dir)
 # Get all the files in the driver directory
@@ -28,7 +31,7 @@ for r, d, f in os.walk(documentation_directory):
 
 for html_file in html_files:
     with open(html_file, encoding="utf8") as open_file:
-        soup = BeautifulSoup(open_file, 'html.parser')
+        soup = myModules.parse_html(open_file)
         if soup.body is None:
             logging.error("No page body found. " + html_file)
             continue
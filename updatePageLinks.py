@@ -3,7 +3,7 @@ import os
 import re
 import sys
 import argparse
-from bs4 import BeautifulSoup as bs
+import myModules
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--mode', '-m', dest='mode', default='rst',
@@ -15,6 +15,8 @@ parser.add_argument('--folder', type=str, default='output',
                     help='Folder to handle', required=True)
 parser.add_argument('--test', action='store_true', default=False,
                     help='Create copies of the original files', required=False)
+parser.add_argument('--parser', default='html.parser', choices=myModules.html_parsers,
+                    help='Parser of the HTML files, html.parser is used when lxml or html5lib is not installed (default html.parser)')
 parser.add_argument('--loglevel', default='debug',
                     choices=['critical', 'error', 'warning', 'info', 'debug'],
                     help='Provide logging level. Example --loglevel debug, default=warning')
@@ -27,6 +29,7 @@ if args.logfile is None:
     logging.basicConfig(level=args.loglevel.upper(), format=args.logformat)
 else:
     logging.basicConfig(level=args.loglevel.upper(), format=args.logformat, filename=args.logfile)
+myModules.set_html_parser(args.parser)
     
 site = args.site
 target_folder = args.folder
@@ -152,7 +155,7 @@ elif file_type == '.html':
     for filename in my_html_files:
         path_and_name = os.path.join(target_folder, filename)
         with open(path_and_name, encoding='utf-8') as file:
-            soup = bs(file, "html.parser")
+            soup = myModules.parse_html(file)
             meta_item = soup.find('meta', attrs={'name': 'ConfluencePageID'})
             if meta_item:
                 my_html_pageid = meta_item.attrs['content']
@@ -184,7 +187,7 @@ elif file_type == '.html':
             all_sfile_lines = sfile.readlines()
 
         with open(path_and_name, 'r', encoding='utf-8') as fp:
-            soup = bs(fp, "html.parser", from_encoding='utf-8')
+            soup = myModules.parse_html(fp, from_encoding='utf-8')
             html = soup.prettify()
             a_elems = soup.findAll('a');
             